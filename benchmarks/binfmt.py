@@ -0,0 +1,268 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import sys
+import json
+import argparse
+import tracemalloc
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from struct import pack
+from os import SEEK_SET
+
+from cod import thin, objconv, objcopy
+from cod.elf import (
+    sizeof, get_elf_class, Elf32, Elf64,
+    EI_CLASS, ELFCLASS32, ELFCLASS64, EI_DATA, ELFDATA2LSB, EI_VERSION, ELFMAG,
+    ET_REL, EM_I386, EM_AMD64, PT_LOAD,
+    SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB, SHT_REL, SHT_RELA,
+    R_I386_32, R_I386_PC32,
+)
+
+ET_EXEC = 2
+
+def ar_header(name, size):
+    return b"%-16s%-12d%-6d%-6d%-8o%-10d`\n" % (name, 0, 0, 0, 0o644, size)
+
+def pad(data):
+    return data + b"\n" * (len(data) % 2)
+
+def make_thin_archive(path, nsyms, nmembers):
+    filenames = b""
+    starts = []
+    for i in range(nmembers):
+        starts.append(len(filenames))
+        filenames += b"obj/m%d.o/\n" % i
+
+    names = b"".join(b"sym_%08d\x00" % i for i in range(nsyms))
+    symsize = 4 + 4 * nsyms + len(names)
+    offset = 8 + 60 + symsize + symsize % 2 + 60 + len(filenames) + len(filenames) % 2
+    members = []
+    offsets = []
+    for i, start in enumerate(starts):
+        offsets.append(offset)
+        members.append(ar_header(b"/%d" % start, 1024))
+        offset += 60
+
+    symtab = pack("!I", nsyms) + b"".join(pack("!I", offsets[i % nmembers]) for i in range(nsyms)) + names
+    with path.open("wb") as f:
+        f.write(b"!<thin>\n")
+        f.write(ar_header(b"/", len(symtab)) + pad(symtab))
+        f.write(ar_header(b"//", len(filenames)) + pad(filenames))
+        f.write(b"".join(members))
+    return path.stat().st_size
+
+def elf_ident(elfclass):
+    ident = bytearray(16)
+    ident[0:4] = ELFMAG
+    ident[EI_CLASS] = elfclass
+    ident[EI_DATA] = ELFDATA2LSB
+    ident[EI_VERSION] = 1
+    return ident
+
+def make_relocatable(path, Elf, nsyms, nrels):
+    elfclass = ELFCLASS32 if Elf is Elf32 else ELFCLASS64
+
+    text = bytes(4 * max(nrels, 1))
+    strtab = b"\x00" + b"".join(b"sym_%08d\x00" % i for i in range(nsyms))
+    syms = [Elf.Sym()]
+    name = 1
+    for i in range(nsyms):
+        sym = Elf.Sym()
+        sym.st_name = name
+        sym.st_info = 0x12 # STB_GLOBAL, STT_FUNC
+        sym.st_shndx = 1
+        sym.st_value = (i * 4) % len(text)
+        syms.append(sym)
+        name += len(b"sym_%08d\x00" % i)
+    symtab = b"".join(bytes(s) for s in syms)
+
+    rels = []
+    for i in range(nrels):
+        sym = 1 + i % max(nsyms, 1)
+        if Elf is Elf32:
+            rel = Elf.Rel()
+            rel.r_info = (sym << 8) | (R_I386_32 if i % 2 else R_I386_PC32)
+        else:
+            rel = Elf.Rela()
+            rel.r_info = (sym << 32) | 2
+        rel.r_offset = i * 4
+        rels.append(rel)
+    reltab = b"".join(bytes(r) for r in rels)
+    reltype, relname = (SHT_REL, b".rel.text") if Elf is Elf32 else (SHT_RELA, b".rela.text")
+
+    shstrtab = b"\x00.text\x00" + relname + b"\x00.symtab\x00.strtab\x00.shstrtab\x00"
+    sections = [
+        (0, 0, b"", 0, 0, 0),
+        (shstrtab.index(b".text"), SHT_PROGBITS, text, 0, 0, 0),
+        (shstrtab.index(relname), reltype, reltab, 3, 1, len(bytes(rels[0])) if rels else sizeof(Elf.Rel)),
+        (shstrtab.index(b".symtab"), SHT_SYMTAB, symtab, 4, 1, sizeof(Elf.Sym)),
+        (shstrtab.index(b".strtab"), SHT_STRTAB, strtab, 0, 0, 0),
+        (shstrtab.index(b".shstrtab"), SHT_STRTAB, shstrtab, 0, 0, 0),
+    ]
+
+    ehdr = Elf.Ehdr()
+    ehdr.e_ident[:] = elf_ident(elfclass)
+    ehdr.e_type = ET_REL
+    ehdr.e_machine = EM_I386 if Elf is Elf32 else EM_AMD64
+    ehdr.e_version = 1
+    ehdr.e_ehsize = sizeof(Elf.Ehdr)
+    ehdr.e_shentsize = sizeof(Elf.Shdr)
+    ehdr.e_shnum = len(sections)
+    ehdr.e_shstrndx = len(sections) - 1
+
+    body = b""
+    shdrs = []
+    offset = ehdr.e_ehsize
+    for name, sh_type, data, link, info, entsize in sections:
+        shdr = Elf.Shdr()
+        shdr.sh_name = name
+        shdr.sh_type = sh_type
+        shdr.sh_offset = offset if sh_type else 0
+        shdr.sh_size = len(data)
+        shdr.sh_link = link
+        shdr.sh_info = info
+        shdr.sh_addralign = 4 if sh_type else 0
+        shdr.sh_entsize = entsize
+        shdrs.append(shdr)
+        body += data
+        offset += len(data)
+    ehdr.e_shoff = offset
+
+    with path.open("wb") as f:
+        f.write(bytes(ehdr))
+        f.write(body)
+        f.write(b"".join(bytes(s) for s in shdrs))
+    return path.stat().st_size
+
+def make_executable(path, Elf, nsegments, segsize):
+    elfclass = ELFCLASS32 if Elf is Elf32 else ELFCLASS64
+
+    ehdr = Elf.Ehdr()
+    ehdr.e_ident[:] = elf_ident(elfclass)
+    ehdr.e_type = ET_EXEC
+    ehdr.e_machine = EM_I386 if Elf is Elf32 else EM_AMD64
+    ehdr.e_version = 1
+    ehdr.e_ehsize = sizeof(Elf.Ehdr)
+    ehdr.e_phoff = ehdr.e_ehsize
+    ehdr.e_phentsize = sizeof(Elf.Phdr)
+    ehdr.e_phnum = nsegments
+
+    phdrs = []
+    offset = ehdr.e_phoff + ehdr.e_phentsize * nsegments
+    for i in range(nsegments):
+        phdr = Elf.Phdr()
+        phdr.p_type = PT_LOAD
+        phdr.p_offset = offset
+        phdr.p_vaddr = phdr.p_paddr = i * segsize * 2
+        phdr.p_filesz = segsize
+        phdr.p_memsz = segsize + segsize // 2
+        phdr.p_align = 4096
+        phdrs.append(phdr)
+        offset += segsize
+
+    with path.open("wb") as f:
+        f.write(bytes(ehdr))
+        f.write(b"".join(bytes(p) for p in phdrs))
+        for i in range(nsegments):
+            f.write(bytes([i & 0xFF]) * segsize)
+    return path.stat().st_size
+
+def parse_elf(path):
+    with path.open("rb") as f:
+        Elf = get_elf_class(f)
+        f.seek(0, SEEK_SET)
+        ehdr = Elf.Ehdr.from_buffer_copy(f.read(sizeof(Elf.Ehdr)))
+        f.seek(ehdr.e_shoff, SEEK_SET)
+        shdrs = [Elf.Shdr.from_buffer_copy(f.read(ehdr.e_shentsize)) for _ in range(ehdr.e_shnum)]
+        nsyms = 0
+        for shdr in shdrs:
+            if shdr.sh_type != SHT_SYMTAB:
+                continue
+            f.seek(shdr.sh_offset, SEEK_SET)
+            for _ in range(0, shdr.sh_size, shdr.sh_entsize):
+                Elf.Sym.from_buffer_copy(f.read(shdr.sh_entsize))
+                nsyms += 1
+        return nsyms
+
+def measure(func, repeat):
+    # tracemalloc slows allocation heavily, so time and memory are measured in separate runs
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run(workdir, symbol_counts, repeat):
+    results = []
+
+    def bench(name, size, nsyms, func):
+        elapsed, peak = measure(func, repeat)
+        results.append({
+            "name": name,
+            "bytes": size,
+            "symbols": nsyms,
+            "seconds": elapsed,
+            "mb_per_s": size / elapsed / 1e6,
+            "symbols_per_s": nsyms / elapsed if nsyms else None,
+            "peak_bytes": peak,
+        })
+
+    for n in symbol_counts:
+        path = workdir / f"thin-{n}.a"
+        size = make_thin_archive(path, n, max(n // 100, 1))
+        bench(f"thin.parse_armap[{n}]", size, n, lambda: thin.parse_armap(path))
+
+    for n in sorted({min(n, 100000) for n in symbol_counts}):
+        for Elf in (Elf32, Elf64):
+            bits = 32 if Elf is Elf32 else 64
+            path = workdir / f"rel{bits}-{n}.o"
+            size = make_relocatable(path, Elf, n, n)
+            bench(f"elf.parse[elf{bits},{n}]", size, n, lambda: parse_elf(path))
+            if Elf is Elf32:
+                out = workdir / f"rel{bits}-{n}.o64"
+                bench(f"objconv.main[{n}]", size, n, lambda: objconv.main(out, path))
+
+    for nsegments in (4, 64):
+        for Elf in (Elf32, Elf64):
+            bits = 32 if Elf is Elf32 else 64
+            path = workdir / f"exec{bits}-{nsegments}.elf"
+            size = make_executable(path, Elf, nsegments, 64 * 1024)
+            out = workdir / f"exec{bits}-{nsegments}.bin"
+            bench(f"objcopy.main[elf{bits},{nsegments}]", size, 0, lambda: objcopy.main(out, path))
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark binary format code paths")
+    parser.add_argument('-n', '--symbols', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as d:
+        results = run(Path(d), args.symbols, args.repeat)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'benchmark':<32} {'seconds':>9} {'MB/s':>9} {'symbols/s':>12} {'peak KiB':>10}")
+    for r in results:
+        symbols_per_s = f"{r['symbols_per_s']:.0f}" if r['symbols_per_s'] else '-'
+        print(f"{r['name']:<32} {r['seconds']:>9.4f} {r['mb_per_s']:>9.2f} {symbols_per_s:>12} {r['peak_bytes']//1024:>10}")
+
+if __name__ == '__main__':
+    main()
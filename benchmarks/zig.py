@@ -0,0 +1,71 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import sys
+import json
+import argparse
+from time import perf_counter
+from pathlib import Path
+from subprocess import check_call, DEVNULL
+from tempfile import TemporaryDirectory
+
+from cod.util import get_zig
+
+LAUNCHERS = {
+    "python -mziglang": [sys.executable, "-mziglang"],
+    "zig": get_zig(),
+}
+
+def measure(argv, count, repeat, cwd):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(count):
+            check_call(argv, cwd=cwd, stdout=DEVNULL)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / count
+
+def run(workdir, count, repeat):
+    (workdir / "a.c").write_text("int a(int x) { return x + 1; }\n")
+    commands = {
+        "version": ["version"],
+        "cc": ["clang", "--target=x86_64-unknown-unknown", "-ffreestanding", "-nostdinc", "-c", "a.c", "-o", "a.o"],
+        "ar": ["ar", "qcs", "a.a", "a.o"],
+    }
+
+    results = []
+    for name, command in commands.items():
+        seconds = {}
+        for launcher, prefix in LAUNCHERS.items():
+            seconds[launcher] = measure(prefix + command, count, repeat, workdir)
+        results.append({
+            "name": name,
+            "seconds": seconds,
+            "overhead": seconds["python -mziglang"] - seconds["zig"],
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark per edge overhead of launching zig")
+    parser.add_argument('-n', '--count', type=int, default=20)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as d:
+        results = run(Path(d), args.count, args.repeat)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'command':<10} {'python -mziglang ms':>20} {'zig ms':>10} {'overhead ms':>12}")
+    for r in results:
+        s = r['seconds']
+        print(f"{r['name']:<10} {s['python -mziglang']*1e3:>20.2f} {s['zig']*1e3:>10.2f} {r['overhead']*1e3:>12.2f}")
+
+if __name__ == '__main__':
+    main()
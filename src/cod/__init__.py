@@ -3,28 +3,73 @@
 
 import argparse
 from .workspace import Workspace
+from .dist import serve
+from .util import parse_size
+
+def add_limit_arguments(parser):
+    parser.add_argument('-j', '--jobs', type=int)
+    parser.add_argument('-l', '--load-average', type=float)
+    parser.add_argument('--memory', type=parse_size)
 
 def main():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(dest='command')
     parser_build = subparsers.add_parser('build')
-    parser_build.add_argument('-a', '--arch')
-    parser_build.add_argument('-p', '--profile', default='dev')
+    parser_build.add_argument('-a', '--arch', action='append')
+    parser_build.add_argument('-p', '--profile', action='append')
+    parser_build.add_argument('--watch', action='store_true')
+    parser_build.add_argument('--frozen', '--locked', action='store_true')
+    parser_build.add_argument('--prune', action='store_true')
+    add_limit_arguments(parser_build)
+    parser_lock = subparsers.add_parser('lock')
+    parser_lock.add_argument('-a', '--arch', action='append')
+    parser_lock.add_argument('-p', '--profile', action='append')
+    parser_lock.add_argument('--prune', action='store_true')
+    add_limit_arguments(parser_lock)
     parser_install = subparsers.add_parser('install')
     parser_install.add_argument('-a', '--arch')
     parser_install.add_argument('-p', '--profile', default='dev')
     parser_install.add_argument('package', nargs='+')
     parser_package = subparsers.add_parser('package')
     parser_package.add_argument('-a', '--arch')
+    parser_package.add_argument('--artifact', action='store_true')
+    add_limit_arguments(parser_package)
+    subparsers.add_parser('cache')
+    parser_worker = subparsers.add_parser('worker')
+    parser_worker.add_argument('--host', default='127.0.0.1')
+    parser_worker.add_argument('--port', type=int, default=0)
+    parser_worker.add_argument('-j', '--jobs', type=int)
+    parser_size = subparsers.add_parser('size')
+    parser_size.add_argument('-a', '--arch')
+    parser_size.add_argument('-p', '--profile', default='dev')
+    parser_size.add_argument('-s', '--symbols', action='store_true')
+    parser_size.add_argument('--json', action='store_true')
+    parser_size.add_argument('--diff', metavar='JSON')
 
     args = parser.parse_args()
-    ws = Workspace()
+    if args.command == 'worker':
+        serve(args.host, args.port, args.jobs)
+        return
+
+    options = {k: v for k, v in vars(args).items() if k in ('jobs', 'load_average', 'memory', 'frozen')}
+    ws = Workspace(**options)
 
     if args.command == 'build':
-        ws.build(args.arch, args.profile)
+        archs = args.arch or [None]
+        profiles = args.profile or ['dev']
+        if args.watch:
+            ws.watch(archs, profiles, args.prune)
+        else:
+            ws.build_matrix(archs, profiles, prune=args.prune)
+    elif args.command == 'lock':
+        ws.update_lock(args.arch or [None], args.profile or ['dev'], args.prune)
     elif args.command == 'install':
         ws.install(args.arch, args.profile, args.package)
     elif args.command == 'package':
-        ws.package(args.arch)
+        ws.package(args.arch, args.artifact)
+    elif args.command == 'cache':
+        ws.cache_stats()
+    elif args.command == 'size':
+        ws.size(args.arch, args.profile, args.json, args.symbols, args.diff)
     else:
         parser.print_help()
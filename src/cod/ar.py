@@ -1,16 +1,20 @@
 # Copyright (c) 2024 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
 import sys
-from pathlib import Path
 from subprocess import call
 
+from .util import get_zig
+
 def main(archive, *files):
-    try:
-        Path(archive).unlink()
-    except FileNotFoundError:
-        pass
-    exit(call((sys.executable, "-mziglang", "ar", "qcs", "--thin", archive) + files))
+    # written next to the archive and moved into place, so builds of top packages
+    # sharing a dependency never see a partly written archive
+    tmp = f"{archive}.{os.getpid()}"
+    returncode = call(get_zig() + ["ar", "qcs", "--thin", tmp, *files])
+    if returncode == 0:
+        os.replace(tmp, archive)
+    exit(returncode)
 
 if __name__ == '__main__':
     main(*sys.argv[1:])
@@ -0,0 +1,128 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+import json
+from pathlib import Path
+from hashlib import sha256
+from shutil import copyfile
+from subprocess import run, call, PIPE, DEVNULL
+from tempfile import NamedTemporaryFile
+
+from .compat import version
+from .util import reflink
+from . import dist
+from .dist import get_workers
+
+def unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def strip_argv(argv, infile, outfile):
+    # paths are left out of the key, the preprocessed source already covers them
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in ('-o', '-MF'):
+            skip = True
+        elif arg.startswith('-I') or arg in (infile, outfile):
+            pass
+        else:
+            result.append(arg)
+    return result
+
+def preprocess(argv):
+    argv = ['-E' if arg == '-c' else arg for arg in argv]
+    i = argv.index('-o')
+    # the depfile written here is the one ninja reads on hits and remote
+    # compiles, it has to name the object and not stdout
+    argv[i:i + 2] = ['-MT', argv[i + 1], '-o', '-']
+    proc = run(argv, stdout=PIPE, stderr=DEVNULL)
+    if proc.returncode == 0:
+        return proc.stdout
+
+def get_input(kind, infile, argv):
+    if kind == 'cc':
+        return preprocess(argv)
+    elif kind == 'objconv':
+        return Path(infile).read_bytes()
+    assert False, f"unknown cache kind {kind}"
+
+def get_key(kind, infile, outfile, argv, data):
+    h = sha256()
+    h.update(kind.encode())
+    h.update(b"\x00")
+    h.update(version('ziglang').encode())
+    h.update(b"\x00")
+
+    if kind == 'cc':
+        h.update(json.dumps(strip_argv(argv, infile, outfile)).encode())
+        if '-include-pch' in argv:
+            # the preprocessed source does not contain what the pch defines
+            h.update(Path(argv[argv.index('-include-pch') + 1]).read_bytes())
+    elif kind == 'objconv':
+        h.update((Path(__file__).parent / "objconv.py").read_bytes())
+
+    h.update(b"\x00")
+    h.update(data)
+    return h.hexdigest()
+
+def compile(kind, infile, outfile, argv, data):
+    workers = get_workers()
+    # workers do not have the pch, compile those locally
+    if kind == 'cc' and workers and '-include-pch' not in argv:
+        returncode = dist.compile(workers, argv, infile, outfile, data)
+        if returncode is not None:
+            return returncode
+    return call(argv)
+
+def record(cachedir, name):
+    path = cachedir / "stats" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # one byte per event, O_APPEND keeps parallel edges from losing counts
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, b".")
+    finally:
+        os.close(fd)
+
+def main(cachedir, kind, infile, outfile, sep, *argv):
+    assert sep == '--'
+    argv = list(argv)
+    data = get_input(kind, infile, argv)
+    if data is None:
+        exit(call(argv))
+
+    unlink(outfile)
+    if cachedir == '-':
+        exit(compile(kind, infile, outfile, argv, data))
+
+    cachedir = Path(cachedir)
+    key = get_key(kind, infile, outfile, argv, data)
+    path = cachedir / "objects" / key[:2] / key
+    if path.exists():
+        # never a hardlink, later edges may rewrite the output in place
+        if not reflink(path, outfile):
+            copyfile(path, outfile)
+        os.utime(outfile)
+        record(cachedir, 'hits')
+        return
+
+    record(cachedir, 'misses')
+    returncode = compile(kind, infile, outfile, argv, data)
+    if returncode != 0:
+        exit(returncode)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        tmp = f.name
+    copyfile(outfile, tmp)
+    os.replace(tmp, path)
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -9,9 +9,9 @@ else:
     from functools import cached_property
 
 if sys.version_info < (3, 10):
-    from importlib_metadata import entry_points
+    from importlib_metadata import entry_points, version
 else:
-    from importlib.metadata import entry_points
+    from importlib.metadata import entry_points, version
 
 if sys.version_info < (3, 11):
     import tomli as tomllib
@@ -1,12 +1,15 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import sys
 import shlex
-from subprocess import check_output, run, PIPE
+from subprocess import check_output, check_call, run, PIPE
 from pathlib import Path
+from tempfile import TemporaryDirectory
 import re
 
+from .thin import parse_armap
+from .util import get_zig
+
 def iter_lines(s):
     full = ''
 
@@ -22,7 +25,7 @@ def iter_lines(s):
         yield full
 
 def get_include_deps(includedirs, f, arch):
-    argv = [sys.executable, "-mziglang", "clang", f"--target={arch}-unknown-unknown", "-nostdinc", "-MM", "-MG"]
+    argv = get_zig() + ["clang", f"--target={arch}-unknown-unknown", "-nostdinc", "-MM", "-MG"]
     argv.extend(f"-I{i}" for i in includedirs)
     s = check_output(argv + [f.name], cwd = f.parent).decode()
 
@@ -35,9 +38,34 @@ def get_include_deps(includedirs, f, arch):
             if not (f.parent / name).exists():
                 yield name
 
+def read_depfile(path):
+    # the inputs a depfile lists, relative to where the compiler ran
+    for line in iter_lines(path.read_text()):
+        parts = shlex.split(line)
+        for name in parts[1:]:
+            yield name
+
+def is_bitcode(path):
+    with open(path, "rb") as f:
+        return f.read(4) == b"BC\xc0\xde"
+
+def get_bitcode_symbol_deps(workdir, target, obj):
+    # lld evaluates the linker script before running LTO, so bitcode is linked
+    # for real, keeping every defined symbol alive with -u
+    with TemporaryDirectory() as d:
+        archive = Path(d) / "defs.a"
+        check_call(get_zig() + ["ar", "qcs", archive, (workdir / obj).absolute()])
+        defs = [f"-Wl,-u,{name}" for name, _ in parse_armap(archive)]
+        return run(
+            get_zig() + ["cc"] + target + defs + [str(obj), "-o", str(Path(d) / "a.out")],
+            stderr=PIPE, text=True, cwd=workdir).stderr
+
 def get_symbol_deps(workdir, target, obj):
-    script = Path(__file__).parent / "always-fail.ld"
-    proc = run(
-        [sys.executable, "-mziglang", "cc"] + target + [f"-Wl,--script={script}", str(obj)],
-        stderr=PIPE, text=True, cwd=workdir)
-    return re.findall(r': error: undefined symbol: (\S+)$', proc.stderr, re.MULTILINE)
+    if is_bitcode(workdir / obj):
+        stderr = get_bitcode_symbol_deps(workdir, target, obj)
+    else:
+        script = Path(__file__).parent / "always-fail.ld"
+        stderr = run(
+            get_zig() + ["cc"] + target + [f"-Wl,--script={script}", str(obj)],
+            stderr=PIPE, text=True, cwd=workdir).stderr
+    return re.findall(r': error: undefined symbol: (\S+)$', stderr, re.MULTILINE)
@@ -0,0 +1,166 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+import json
+import random
+import socket
+from pathlib import Path
+from struct import pack, unpack
+from threading import Semaphore
+from subprocess import run, PIPE
+from tempfile import TemporaryDirectory
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+
+from .compat import version
+from .util import get_zig
+
+# every message is a u32 big endian length, a JSON header of that length,
+# and header["size"] bytes of payload
+#
+#   request   {"argv": [...], "lang": "cpp-output" | "assembler", "version": str}, preprocessed source
+#   response  {"returncode": int | null, "stderr": str}, object file
+#
+# the returncode is null when the worker runs another zig version, the request
+# is then compiled elsewhere
+
+CONNECT_TIMEOUT = 2
+
+# the worker runs clang with what clients send, only code generation flags are
+# accepted, anything else could have clang load or run code on the worker, e.g.
+# -Xclang -load, -fplugin= or -B
+ALLOWED = ('-O', '-f', '-m', '-g', '-D', '-U', '-W', '-w', '-std=', '--target=', '-nostdinc', '-nostdlib')
+DENIED = (
+    '-fplugin', '-fpass-plugin', '-fprofile', '-fcrash-diagnostics', '-fmodule',
+    '-fsanitize-ignorelist', '-fsanitize-blacklist', '-fsave-optimization-record',
+    '-ftime-trace', '-fproc-stat-report', '-mllvm', '-Wl,', '-Wa,', '-Wp,')
+SEPARATE = ('-target', '-D', '-U')
+LANGS = ('cpp-output', 'assembler')
+
+def get_workers():
+    workers = os.environ.get('COD_WORKERS')
+    if not workers:
+        return []
+    result = []
+    for worker in workers.split(','):
+        host, port = worker.strip().rsplit(':', 1)
+        result.append((host, int(port)))
+    return result
+
+def send(f, header, payload=b""):
+    data = json.dumps(dict(header, size=len(payload))).encode()
+    f.write(pack("!I", len(data)) + data)
+    f.write(payload)
+    f.flush()
+
+def recv_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError("connection closed")
+    return data
+
+def recv(f):
+    size, = unpack("!I", recv_exact(f, 4))
+    header = json.loads(recv_exact(f, size))
+    return header, recv_exact(f, header['size'])
+
+def strip_argv(argv, infile, outfile):
+    # only flags that affect code generation are sent, the source is already preprocessed
+    args = argv[argv.index('clang') + 1:]
+    result = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ('-o', '-MF'):
+            skip = True
+        elif arg.startswith('-I') or arg in ('-c', '-MMD', infile, outfile):
+            pass
+        else:
+            result.append(arg)
+    return result
+
+def check_argv(argv):
+    result = []
+    args = iter(argv)
+    for arg in args:
+        if arg in SEPARATE:
+            value = next(args, None)
+            if value is None:
+                raise ValueError(f"missing value for {arg}")
+            result += [arg, value]
+        elif arg.startswith(ALLOWED) and not arg.startswith(DENIED):
+            result.append(arg)
+        else:
+            raise ValueError(f"flag not allowed on workers: {arg}")
+    return result
+
+def request(worker, header, payload):
+    with socket.create_connection(worker, timeout=CONNECT_TIMEOUT) as sock:
+        sock.settimeout(None)
+        with sock.makefile("rwb") as f:
+            send(f, header, payload)
+            return recv(f)
+
+def compile(workers, argv, infile, outfile, data):
+    # returns None when no worker could be reached, the caller compiles locally
+    try:
+        argv = check_argv(strip_argv(argv, infile, outfile))
+    except ValueError:
+        return None
+    header = {
+        "argv": argv,
+        "lang": "assembler" if infile.endswith(".S") else "cpp-output",
+        "version": version('ziglang'),
+    }
+    workers = list(workers)
+    random.shuffle(workers)
+    for worker in workers:
+        try:
+            response, obj = request(worker, header, data)
+        except (OSError, EOFError, ValueError):
+            continue
+        if response['returncode'] is None:
+            continue
+        sys.stderr.write(response['stderr'])
+        if response['returncode'] == 0:
+            with open(outfile, "wb") as f:
+                f.write(obj)
+        return response['returncode']
+
+class Handler(StreamRequestHandler):
+
+    def handle(self):
+        header, data = recv(self.rfile)
+        if header.get('version') != version('ziglang'):
+            send(self.wfile, {"returncode": None, "stderr": ""})
+            print(f"cod worker: rejected zig version {header.get('version')}", flush=True)
+            return
+        try:
+            args = check_argv(header['argv'])
+            assert header['lang'] in LANGS, f"language not allowed on workers: {header['lang']}"
+        except (ValueError, AssertionError) as e:
+            send(self.wfile, {"returncode": 1, "stderr": f"cod worker: {e}\n"})
+            print(f"cod worker: rejected {e}", flush=True)
+            return
+        with self.server.slots, TemporaryDirectory() as d:
+            src = Path(d) / "input"
+            out = Path(d) / "output.o"
+            src.write_bytes(data)
+            argv = get_zig() + ["clang"] + args + ["-x", header['lang'], "-c", str(src), "-o", str(out)]
+            proc = run(argv, stderr=PIPE, text=True)
+            obj = out.read_bytes() if proc.returncode == 0 else b""
+        send(self.wfile, {"returncode": proc.returncode, "stderr": proc.stderr}, obj)
+        print(f"cod worker: compiled {len(data)} bytes, returncode {proc.returncode}", flush=True)
+
+class Server(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+def serve(host='127.0.0.1', port=0, jobs=None):
+    with Server((host, port), Handler) as server:
+        server.slots = Semaphore(jobs or os.cpu_count() or 1)
+        host, port = server.server_address[:2]
+        print(f"cod worker: listening on {host}:{port}", flush=True)
+        server.serve_forever()
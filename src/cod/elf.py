@@ -59,6 +59,17 @@ SHT_REL      = 9
 SHT_LOOS     = 0x60000000
 SHT_LLVM_ADDRSIG = SHT_LOOS + 0xfff4c03
 
+SHF_WRITE     = 0x1
+SHF_ALLOC     = 0x2
+SHF_EXECINSTR = 0x4
+
+SHN_UNDEF     = 0
+SHN_LORESERVE = 0xff00
+
+STB_LOCAL = 0
+
+STT_FILE = 4
+
 PT_LOAD = 1
 
 R_I386_32   = 1
@@ -0,0 +1,73 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+from struct import pack, unpack_from, calcsize
+
+# clang header map, passed to clang with -I like a directory, looks up an
+# #include name in one hash probe instead of a stat per include directory
+#
+#   header   magic "pamh", version 1, reserved, strings offset, entries, buckets, max value length
+#   buckets  key, prefix, suffix as offsets into the string table, key 0 is empty
+#   strings  NUL terminated, offset 0 is reserved
+
+MAGIC = 0x686d6170
+HEADER = "<IHHIIII"
+BUCKET = "<III"
+
+def hash_key(key):
+    return sum(ord(c.lower()) * 13 for c in key) & 0xffffffff
+
+def build(entries):
+    # entries: {include name: absolute path}
+    nbuckets = 1
+    while nbuckets < len(entries) * 2:
+        nbuckets *= 2
+
+    strings = bytearray(b"\0")
+    def add(s):
+        offset = len(strings)
+        strings.extend(s.encode() + b"\0")
+        return offset
+
+    buckets = [(0, 0, 0)] * nbuckets
+    maxlen = 0
+    for key, path in entries.items():
+        prefix, suffix = os.path.split(path)
+        prefix = os.path.join(prefix, "")
+        maxlen = max(maxlen, len(prefix) + len(suffix))
+        i = hash_key(key) & (nbuckets - 1)
+        while buckets[i][0]:
+            i = (i + 1) & (nbuckets - 1)
+        buckets[i] = add(key), add(prefix), add(suffix)
+
+    offset = calcsize(HEADER) + calcsize(BUCKET) * nbuckets
+    header = pack(HEADER, MAGIC, 1, 0, offset, len(entries), nbuckets, maxlen)
+    return header + b"".join(pack(BUCKET, *b) for b in buckets) + bytes(strings)
+
+def read(data):
+    magic, version, _, offset, _, nbuckets, _ = unpack_from(HEADER, data)
+    assert magic == MAGIC and version == 1
+
+    def string(i):
+        start = offset + i
+        return data[start:data.index(b"\0", start)].decode()
+
+    entries = {}
+    for i in range(nbuckets):
+        key, prefix, suffix = unpack_from(BUCKET, data, calcsize(HEADER) + calcsize(BUCKET) * i)
+        if key:
+            entries[string(key)] = string(prefix) + string(suffix)
+    return entries
+
+def write(path, entries):
+    data = build(entries)
+    try:
+        if path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
@@ -0,0 +1,80 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import json
+from shutil import copyfileobj
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+from . import store
+from .repo import IndexedRepo
+from .symtab import SymbolTable
+
+# server layout, relative to url
+#
+#   revision              current revision, served with an ETag
+#   index.json            {pkgid: info}
+#   delta/<revision>.json {"added": {pkgid: info}, "removed": [pkgid]} since revision
+#   packages/<pkgid>.tar  package directory, info may carry its sha256 so a
+#                         package already in the store is not downloaded again
+#   symbols/<pkgid>.sym   symbol table, optional
+
+class HttpRepo(IndexedRepo):
+
+    def __init__(self, cache_dir, config):
+        super().__init__(cache_dir, config)
+        self.url = config['url'].rstrip('/')
+
+    def open(self, path, headers={}):
+        return urlopen(Request(f"{self.url}/{path}", headers=headers))
+
+    def get_revision(self, etag):
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            with self.open("revision", headers) as f:
+                return f.read().decode().strip(), f.headers.get('ETag')
+        except HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+
+    def get_delta(self, revision):
+        try:
+            with self.open(f"delta/{revision}.json") as f:
+                return json.load(f)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def get_index(self):
+        with self.open("index.json") as f:
+            return json.load(f)
+
+    def get_path(self, pkgid):
+        return self.cache_dir / "packages" / pkgid
+
+    def fetch(self, pkgid):
+        path = self.get_path(pkgid)
+        if path.exists():
+            return
+        digest = self.get_info(pkgid).get('sha256')
+        store.fetch(path, pkgid, digest, lambda: self.open(f"packages/{pkgid}.tar"))
+
+    def get_symbols(self, pkgid):
+        path = self.cache_dir / "symbols" / f"{pkgid}.sym"
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}")
+            try:
+                with self.open(f"symbols/{pkgid}.sym") as f, tmp.open("wb") as out:
+                    copyfileobj(f, out)
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
+                # remember packages without symbols as an empty file
+                tmp.write_bytes(b"")
+            os.replace(tmp, path)
+        if path.stat().st_size:
+            return SymbolTable.load(path)
@@ -1,14 +1,20 @@
 # Copyright (c) 2024 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import json
 from configparser import RawConfigParser
 from contextlib import contextmanager
+from hashlib import sha256
 
 import solv
 
 from .package import PackageId
+from .util import update_file
+from .compat import cached_property
 
 
+MEMO_SIZE = 256
+
 def add_package(repo, vendor, pkgid, info):
     pool = repo.pool
     repodata = repo.first_repodata()
@@ -35,17 +41,54 @@ def add_package(repo, vendor, pkgid, info):
         pkg.add_deparray(solv.SOLVABLE_PROVIDES, dep)
         pkg.add_deparray(solv.SOLVABLE_CONFLICTS, dep)
 
+    return pkg
+
+def group_by_repo(packages):
+    repos = {}
+    for pkgid, name in packages:
+        repos.setdefault(name, []).append(pkgid)
+    return repos
+
+def get_conflicts(symtabs):
+    # symbols defined by packages of different names, one pass over every table
+    owners = {}
+    conflicts = set()
+    for (pkgid, _), table in symtabs.items():
+        if not table:
+            continue
+        name = PackageId.from_str(pkgid).name
+        for symbol in table:
+            if owners.setdefault(symbol, name) != name:
+                conflicts.add(symbol)
+    return conflicts
+
+def get_packages(repo):
+    packages = []
+    for solvable in repo.solvables_iter():
+        pkgid = str(PackageId.from_solvable(solvable))
+        packages.append((pkgid, solvable.vendor))
+    return packages
+
 
 class Lock:
 
-    def __init__(self, path, repos):
+    def __init__(self, path, repos, memo_path=None):
         self.path = path
         self.profiles = {}
+        self.changed = True
+        self.checksum = sha256()
+        self.arch = None
+
+        # symbol provides are only added to the pool once some build asks for them,
+        # or up front when packages of different names define them and conflict
+        self.symtabs = {}
+        self.solvables = []
+        self.symbols = set()
+        self.conflicts = set()
+
+        self.memo_path = memo_path
 
-        self.pool = solv.Pool()
         self.repos = repos
-        for name, repo in repos.items():
-            self.add_repo(name, repo)
 
         parser = RawConfigParser(delimiters=('=',))
         try:
@@ -56,79 +99,167 @@ class Lock:
             with f:
                 parser.read_file(f)
 
-            for profile_name in parser.sections():
-                with self(profile_name, save=False):
-                    self._install(parser.items(profile_name))
-
+        # profiles are only added to the pool when first used
+        self.locked = {
+            profile_name: parser.items(profile_name)
+            for profile_name in parser.sections()}
+        self.fetched = set()
         self.dirty = False
 
-    def add_repo(self, name, repo):
-        r = self.pool.add_repo(f"repo.{name}")
+    @cached_property
+    def pool(self):
+        # reads the info and symbols of every package in every repo, only done
+        # once something has to be solved, builds from cod.lock never need it
+        pool = solv.Pool()
+        infos = {name: repo.get_info_many(list(repo)) for name, repo in self.repos.items()}
+        for name, packages in infos.items():
+            for pkgid, table in self.repos[name].get_symbols_many(list(packages)).items():
+                self.symtabs[pkgid, name] = table
+        self.conflicts = get_conflicts(self.symtabs)
+        self.symbols.update(self.conflicts)
+        for name, packages in infos.items():
+            self.add_repo(pool, name, packages)
+        return pool
+
+    @cached_property
+    def memo(self):
+        # solver results for the repos as they are now, results for any other
+        # state of the repos are dropped, the checksum covers them once the pool is built
+        self.pool
+        checksum = self.checksum.hexdigest()
+        try:
+            with self.memo_path.open() as f:
+                memo = json.load(f)
+        except (AttributeError, OSError, ValueError):
+            return {}
+        if not isinstance(memo, dict) or memo.get("checksum") != checksum:
+            return {}
+        return memo.get("results", {})
+
+    def save_memo(self):
+        if self.memo_path is None:
+            return
+        # oldest results first, so the file stays bounded within one repo state too
+        results = dict(list(self.memo.items())[-MEMO_SIZE:])
+        update_file(self.memo_path, json.dumps({"checksum": self.checksum.hexdigest(), "results": results}))
+
+    def add_repo(self, pool, name, packages):
+        r = pool.add_repo(f"repo.{name}")
         repodata = r.add_repodata()
-        for pkgid in repo:
-            info = repo.get_info(pkgid)
-            add_package(r, name, pkgid, info)
+        for pkgid, info in packages.items():
+            self.add_package(r, name, pkgid, info)
+            self.checksum.update(json.dumps([name, pkgid, info], sort_keys=True).encode())
+            if self.symtabs[pkgid, name]:
+                self.checksum.update(self.symtabs[pkgid, name].digest)
         repodata.internalize()
+        self.changed = True
+
+    def add_package(self, repo, name, pkgid, info):
+        solvable = add_package(repo, name, pkgid, info)
+        if (pkgid, name) not in self.symtabs:
+            self.symtabs[pkgid, name] = self.repos[name].get_symbols(pkgid)
+        table = self.symtabs[pkgid, name]
+        if not table:
+            return
+
+        self.solvables.append((solvable, table))
+        for symbol in self.symbols:
+            if symbol in table:
+                dep = repo.pool.str2id(f"({symbol})")
+                solvable.add_deparray(solv.SOLVABLE_PROVIDES, dep)
+                if symbol in self.conflicts:
+                    solvable.add_deparray(solv.SOLVABLE_CONFLICTS, dep)
+
+    def add_symbol_provides(self, names):
+        for name in names:
+            if not (name.startswith("(") and name.endswith(")")):
+                continue
+            symbol = name[1:-1]
+            if symbol in self.symbols:
+                continue
+            self.symbols.add(symbol)
+            dep = self.pool.str2id(name)
+            for solvable, table in self.solvables:
+                if symbol in table:
+                    solvable.add_deparray(solv.SOLVABLE_PROVIDES, dep)
+                    self.changed = True
 
     def __getitem__(self, profile_name):
-        packages = []
         if profile_name in self.profiles:
-            for solvable in self.profiles[profile_name].solvables_iter():
-                pkgid = str(PackageId.from_solvable(solvable))
-                packages.append((pkgid, solvable.vendor))
-        return packages
+            return get_packages(self.profiles[profile_name])
+        return list(self.locked.get(profile_name, []))
 
     @contextmanager
     def __call__(self, profile_name, save=True):
         arch = profile_name.rsplit(".", 1)[1]
-        self.pool.setarch(arch)
+        if arch != self.arch:
+            self.pool.setarch(arch)
+            self.arch = arch
+            self.changed = True
 
         if profile_name not in self.profiles:
             r = self.pool.add_repo(f"profile.{profile_name}")
             r.add_repodata()
             self.profiles[profile_name] = r
+            self._add(r, self.locked.pop(profile_name, []))
 
-        old = self.pool.installed
-        self.pool.installed = self.profiles[profile_name]
-        try:
-            yield
-            if save:
-                self.save()
-        finally:
-            self.pool.installed = old
+        # libsolv drops whatprovides whenever installed repo changes, so it is
+        # switched only when needed and left in place for the next call
+        if self.pool.installed != self.profiles[profile_name]:
+            self.pool.installed = self.profiles[profile_name]
+            self.changed = True
 
-    def install_provides(self, provides):
+        yield
+        if save:
+            self.save()
+
+    def createwhatprovides(self):
+        if not self.changed:
+            return
         self.pool.addfileprovides()
         self.pool.createwhatprovides()
-        jobs = []
-        for name in provides:
-            jobs += self.pool.select(
-                name,
-                solv.Selection.SELECTION_PROVIDES).jobs(
-                    solv.Job.SOLVER_INSTALL)
-        self.install(jobs)
+        self.changed = False
+
+    def memo_key(self, names):
+        h = sha256()
+        h.update(json.dumps([self.arch, sorted(get_packages(self.pool.installed)), sorted(names)]).encode())
+        return h.hexdigest()
+
+    def install_provides(self, provides):
+        self.install_names(provides)
 
     def install_from_symbols(self, symbols):
-        self.pool.addfileprovides()
-        self.pool.createwhatprovides()
-        jobs = []
-        for name in symbols:
-            jobs += self.pool.select(
-                f"({name})",
-                solv.Selection.SELECTION_PROVIDES).jobs(
-                    solv.Job.SOLVER_INSTALL)
-        self.install(jobs)
+        self.install_names([f"({name})" for name in symbols])
 
     def install_packages(self, packages):
-        self.pool.addfileprovides()
-        self.pool.createwhatprovides()
-        jobs = []
-        for name in packages:
-            jobs += self.pool.select(
-                name,
-                solv.Selection.SELECTION_PROVIDES).jobs(
-                    solv.Job.SOLVER_INSTALL)
-        self.install(jobs)
+        self.install_names(packages)
+
+    def install_names(self, names):
+        key = self.memo_key(names)
+        if key in self.memo:
+            # moved to the end, results used last are kept longest
+            self.memo[key] = self.memo.pop(key)
+            packages = [tuple(p) for p in self.memo[key]]
+            if packages:
+                self._install(packages)
+            return
+
+        self.add_symbol_provides(names)
+        self.createwhatprovides()
+        installed = self.pool.installed
+        selections = [
+            self.pool.select(name, solv.Selection.SELECTION_PROVIDES)
+            for name in names]
+
+        packages = []
+        if not all(any(s.repo == installed for s in sel.solvables()) for sel in selections):
+            jobs = []
+            for sel in selections:
+                jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+            packages = self.install(jobs)
+
+        self.memo[key] = packages
+        self.save_memo()
 
     def install(self, jobs):
         solver = self.pool.Solver()
@@ -149,7 +280,7 @@ class Lock:
 
         trans = solver.transaction()
         if trans.isempty():
-            return
+            return []
 
         packages = []
         for solvable in trans.steps():
@@ -157,23 +288,49 @@ class Lock:
             packages.append((pkgid, solvable.vendor))
 
         self._install(packages)
+        return packages
 
-    def _install(self, packages):
+    def _add(self, repo, packages):
+        infos = {}
+        for name, pkgids in group_by_repo(packages).items():
+            infos[name] = self.repos[name].get_info_many(pkgids)
         for pkgid, name in packages:
-            self.repos[name].fetch(pkgid)
+            self.add_package(repo, name, pkgid, infos[name][pkgid])
+        repo.first_repodata().internalize()
+        self.changed = True
 
-        r = self.pool.installed
-        for pkgid, name in packages:
-            info = self.repos[name].get_info(pkgid)
-            add_package(r, name, pkgid, info)
-        r.first_repodata().internalize()
+    def _install(self, packages):
+        self._add(self.pool.installed, packages)
+        self.dirty = True
+
+    def retain(self, profile_name, packages):
+        # drops the locked packages of a profile not listed, returns whether any were
+        keep = [p for p in self[profile_name] if p in packages]
+        if len(keep) == len(self[profile_name]):
+            return False
+
+        repo = self.profiles.pop(profile_name, None)
+        if repo is not None:
+            self.solvables = [(s, t) for s, t in self.solvables if s.repo != repo]
+            repo.free(True)
+            self.changed = True
+        # added back to the pool from the section when used again
+        self.locked[profile_name] = keep
         self.dirty = True
+        self.save()
+        return True
+
+    def fetch(self, packages):
+        packages = [p for p in packages if p not in self.fetched]
+        for name, pkgids in group_by_repo(packages).items():
+            self.repos[name].fetch_many(pkgids)
+        self.fetched.update(packages)
 
     def save(self):
         if not self.dirty:
             return
 
-        profile_names = list(self.profiles)
+        profile_names = list(self.profiles) + list(self.locked)
         profile_names.sort()
 
         parser = RawConfigParser(delimiters=('=',))
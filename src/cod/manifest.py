@@ -1,10 +1,15 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
+import json
+from pathlib import Path
 from typing import List, Dict, Union, Optional
 
 from pydantic import BaseModel, Field
 
+from .compat import tomllib
+
 def normalize_flags(flags):
     if isinstance(flags, str):
         return [flags]
@@ -22,6 +27,8 @@ class BuildFlags(BaseModel):
     ldflags: Optional[Union[str, List[str]]] = None
     linker_script: Optional[str] = Field(alias="linker-script", default=None)
     format: Optional[str] = None
+    lto: Optional[str] = None
+    pch: Optional[str] = None
 
     def normalize(self):
         return BuildFlags(
@@ -29,6 +36,8 @@ class BuildFlags(BaseModel):
             sflags = normalize_flags(self.sflags),
             ldflags = normalize_flags(self.ldflags),
             format = self.format,
+            lto = self.lto,
+            pch = self.pch,
             linker_script = self.linker_script)
 
     def __add__(self, other):
@@ -39,6 +48,8 @@ class BuildFlags(BaseModel):
             sflags = a.sflags + b.sflags,
             ldflags = a.ldflags + b.ldflags,
             format = other.format or self.format,
+            lto = other.lto or self.lto,
+            pch = other.pch or self.pch,
             linker_script = other.linker_script or self.linker_script)
 
 class Package(BaseModel):
@@ -49,7 +60,12 @@ class Package(BaseModel):
     arch: Optional[Union[str, List[str]]] = None
 
 class Profile(BaseModel):
+    class Config:
+        populate_by_name = True
+
     build: Union[Dict[str, BuildFlags], BuildFlags] = BuildFlags()
+    unity: int = 0
+    unity_exclude: List[str] = Field(alias="unity-exclude", default=[])
 
 class PackageManifest(BaseModel):
     package: Package
@@ -58,13 +74,62 @@ class PackageManifest(BaseModel):
     profile: Dict[str, Profile] = {}
 
 class Project(BaseModel):
-    pass
+    class Config:
+        populate_by_name = True
+
+    header_map: bool = Field(alias="header-map", default=False)
 
 class ProjectManifest(BaseModel):
     project: Project
     build: Union[Dict[str, BuildFlags], BuildFlags] = BuildFlags()
     repo: Dict[str, dict] = {}
 
+_loaded = {}
+
+def get_stamp(path):
+    st = path.stat()
+    # a changed schema must not reuse manifests validated by an older one
+    return st.st_mtime_ns, st.st_size, Path(__file__).stat().st_mtime_ns
+
+def load_cached(cache, stamp, model):
+    # the cache may come with a fetched package, it is only ever read as data,
+    # and anything wrong with it is a miss
+    try:
+        with cache.open("rb") as f:
+            cached = json.load(f)
+        if cached["stamp"] != list(stamp):
+            return None
+        return model.model_validate(cached["data"])
+    except Exception:
+        return None
+
+def save_cached(cache, stamp, result):
+    if not cache.parent.is_dir():
+        return
+    tmp = cache.with_name(f"{cache.name}.{os.getpid()}")
+    try:
+        with tmp.open("w") as f:
+            json.dump({"stamp": list(stamp), "data": result.model_dump(mode='json', by_alias=True)}, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+
+def load(path, model):
+    path = Path(path).absolute()
+    stamp = get_stamp(path)
+    key = path, model
+    if key in _loaded and _loaded[key][0] == stamp:
+        return _loaded[key][1]
+
+    cache = path.parent / ".cod" / f"{model.__name__}.json"
+    result = load_cached(cache, stamp, model)
+    if result is None:
+        with path.open("rb") as f:
+            result = model.model_validate(tomllib.load(f))
+        save_cached(cache, stamp, result)
+    _loaded[key] = stamp, result
+    return result
+
 def write_compiler_variables(ninja, flags, suffix=''):
     if isinstance(flags, dict):
         for k, v in flags.items():
@@ -79,3 +144,6 @@ def write_compiler_variables(ninja, flags, suffix=''):
         ninja.variable(f'cflags{suffix}', [f'$cflags{suffix}'] + flags.cflags)
     if flags.sflags:
         ninja.variable(f'sflags{suffix}', [f'$sflags{suffix}'] + flags.sflags)
+    if flags.lto:
+        assert flags.lto in ('thin', 'full'), f"unknown lto mode {flags.lto}"
+        ninja.variable(f'lto{suffix}', f'-flto={flags.lto}')
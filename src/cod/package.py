@@ -1,13 +1,19 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
+import json
+import fnmatch
+from hashlib import sha256
+from pathlib import Path
 from dataclasses import dataclass
 
 from .dep import get_include_deps
 from . import manifest
 from .manifest import write_compiler_variables
 from .ninja import NinjaWriter
-from .compat import relative_to, tomllib, cached_property
+from .compat import relative_to, cached_property
+from .util import update_file
 
 @dataclass(frozen=True)
 class EVR:
@@ -50,18 +56,48 @@ class PackageId:
     def __str__(self):
         return f"{self.name}-{self.evr}.{self.arch}"
 
-def find_files(path, pattern, suffix, prefix="."):
-    return {prefix / (f.relative_to(path).with_suffix(suffix)):f
-            for f in path.rglob(pattern)}
+SCAN_DIRS = ("src", "bin", "include", "arch")
+
+def scan_dir(path, key, cache, result):
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return
+    # a directory's mtime only changes when entries are added, removed or
+    # renamed, so an unchanged one is not listed again
+    entry = cache.get(key)
+    if entry is None or entry[0] != mtime:
+        files, dirs = [], []
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.name)
+                elif e.is_file():
+                    files.append(e.name)
+        entry = [mtime, sorted(files), sorted(dirs)]
+    result[key] = entry
+    for name in entry[2]:
+        scan_dir(path / name, f"{key}/{name}", cache, result)
+
+def scan_files(rootdir):
+    path = rootdir / ".cod" / "files.json"
+    try:
+        cache = json.loads(path.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    result = {}
+    for name in SCAN_DIRS:
+        scan_dir(rootdir / name, name, cache, result)
+    if result != cache and path.parent.is_dir():
+        update_file(path, json.dumps(result))
+    return result
 
 class Package:
 
     def __init__(self, rootdir):
         self.rootdir = rootdir
 
-        with (self.rootdir / "cod.toml").open("rb") as f:
-            toml = tomllib.load(f)
-        self.manifest = manifest.PackageManifest.model_validate(toml)
+        self.manifest = manifest.load(self.rootdir / "cod.toml", manifest.PackageManifest)
         package = self.manifest.package
         self.name = package.name
         self.evr = EVR(package.epoch, package.version, package.release)
@@ -69,6 +105,39 @@ class Package:
         if isinstance(arch, str):
             arch = [arch]
         self.arch = arch
+        self.include_deps = {}
+
+    @cached_property
+    def files(self):
+        return scan_files(self.rootdir)
+
+    def invalidate(self, paths):
+        # returns whether files were added or removed
+        old = self.__dict__.pop('files', {})
+        if any(path.suffix == '.h' for path in paths):
+            self.include_deps.clear()
+        else:
+            for key in list(self.include_deps):
+                if key[1] in paths:
+                    del self.include_deps[key]
+        return {k: v[1:] for k, v in old.items()} != {k: v[1:] for k, v in self.files.items()}
+
+    def get_include_deps(self, includedirs, f, arch):
+        key = tuple(includedirs), f, arch
+        if key not in self.include_deps:
+            self.include_deps[key] = list(get_include_deps(includedirs, f, arch))
+        return self.include_deps[key]
+
+    def find_files(self, path, pattern, suffix, prefix="."):
+        base = path.relative_to(self.rootdir).as_posix()
+        result = {}
+        for key, (_, names, _) in self.files.items():
+            if key != base and not key.startswith(base + "/"):
+                continue
+            for name in fnmatch.filter(names, pattern):
+                rel = Path(key[len(base)+1:], name)
+                result[prefix / rel.with_suffix(suffix)] = self.rootdir / key / name
+        return result
 
 def get_build_flags(build, arch):
     if isinstance(build, manifest.BuildFlags):
@@ -102,6 +171,8 @@ class Profile:
         self.includedirs = [package.rootdir / "include"]
         if self.archdir:
             self.includedirs.append(self.archdir / "include")
+        # headers from other packages, <name>
+        self.requires = []
 
     def __lt__(self, other):
         return str(self.id) < str(other.id)
@@ -116,6 +187,24 @@ class Profile:
     def export_flags(self):
         return get_build_flags(self.package.manifest.export, self.top_arch)
 
+    @cached_property
+    def export_pch(self):
+        if self.export_flags.pch:
+            return self.package.rootdir / self.export_flags.pch
+
+    @cached_property
+    def source_digest(self):
+        # everything that goes into the objects of the package
+        paths = set(self.objs.values()) | set(self.includefiles.values())
+        paths.add(self.package.rootdir / "cod.toml")
+        if self.build_flags.pch:
+            paths.add(self.package.rootdir / self.build_flags.pch)
+        h = sha256()
+        for path in sorted(paths):
+            h.update(relative_to(path, self.package.rootdir).encode() + b"\0")
+            h.update(sha256(path.read_bytes()).digest())
+        return h.hexdigest()
+
     @cached_property
     def archdir(self):
         if self.arch != 'noarch':
@@ -123,38 +212,57 @@ class Profile:
 
     @cached_property
     def elfs(self):
-        d = find_files(self.package.rootdir / "bin", "*.c", ".elf")
-        d.update(find_files(self.package.rootdir / "bin", "*.S", ".elf"))
+        d = self.package.find_files(self.package.rootdir / "bin", "*.c", ".elf")
+        d.update(self.package.find_files(self.package.rootdir / "bin", "*.S", ".elf"))
         if self.archdir:
-            d.update(find_files(self.archdir / "bin", "*.c", ".elf"))
-            d.update(find_files(self.archdir / "bin", "*.S", ".elf"))
+            d.update(self.package.find_files(self.archdir / "bin", "*.c", ".elf"))
+            d.update(self.package.find_files(self.archdir / "bin", "*.S", ".elf"))
         return d
 
     @cached_property
     def objs(self):
-        d = find_files(self.package.rootdir / "src", "*.c", ".o")
-        d.update(find_files(self.package.rootdir / "src", "*.S", ".s.o"))
+        d = self.package.find_files(self.package.rootdir / "src", "*.c", ".o")
+        d.update(self.package.find_files(self.package.rootdir / "src", "*.S", ".s.o"))
         if self.archdir:
-            d.update(find_files(self.archdir / "src", "*.c", ".o", "asm"))
-            d.update(find_files(self.archdir / "src", "*.S", ".s.o", "asm"))
+            d.update(self.package.find_files(self.archdir / "src", "*.c", ".o", "asm"))
+            d.update(self.package.find_files(self.archdir / "src", "*.S", ".s.o", "asm"))
         return d
 
+    @cached_property
+    def unity(self):
+        # {unity object: sources}, sources listed in unity-exclude, e.g. those
+        # with static names clashing with another source, are compiled alone
+        n = self.manifest.unity
+        if n < 2:
+            return {}
+        srcs = []
+        for key, src in sorted(self.objs.items()):
+            path = src.relative_to(self.package.rootdir).as_posix()
+            if src.suffix == '.c' and not any(fnmatch.fnmatch(path, p) for p in self.manifest.unity_exclude):
+                srcs.append(src)
+        return {Path("unity", f"{self.id.name}-{i // n}.o"): srcs[i:i+n] for i in range(0, len(srcs), n)}
+
+    def write_unity(self, basedir):
+        members = {src for srcs in self.unity.values() for src in srcs}
+        objs = {key: src for key, src in self.objs.items() if src not in members}
+        for key, srcs in self.unity.items():
+            path = basedir / key.with_suffix(".c")
+            update_file(path, "".join(f'#include "{relative_to(src, path.parent)}"\n' for src in srcs))
+            objs[key] = path
+        return objs
+
     @cached_property
     def includefiles(self):
-        d = find_files(self.package.rootdir / "include", "*.h", ".h")
+        d = self.package.find_files(self.package.rootdir / "include", "*.h", ".h")
         if self.archdir:
-            d.update(find_files(self.archdir / "include", "*.h", ".h"))
+            d.update(self.package.find_files(self.archdir / "include", "*.h", ".h"))
         return d
 
-    @cached_property
-    def includedeps(self):
+    def get_includedeps(self, parallel_map):
+        files = list(self.includefiles.values()) + list(self.objs.values()) + list(self.elfs.values())
         deps = set()
-        for f in self.includefiles.values():
-            deps.update(get_include_deps(self.includedirs, f, self.build_arch))
-        for f in self.objs.values():
-            deps.update(get_include_deps(self.includedirs, f, self.build_arch))
-        for f in self.elfs.values():
-            deps.update(get_include_deps(self.includedirs, f, self.build_arch))
+        for names in parallel_map(lambda f: self.package.get_include_deps(self.includedirs, f, self.build_arch), files).values():
+            deps.update(names)
         return [f"<{h}>" for h in deps]
 
     def validate_headers(self, provides):
@@ -181,9 +289,27 @@ class Profile:
         self.write_linker_variables(rootdir, ninja, self.export_flags)
         write_compiler_variables(ninja, self.package.manifest.export)
 
-    def write_build_objs(self, rootdir, ninja, objs):
+    def write_build_objs(self, rootdir, ninja, objs, pch):
         ninja.variable('cflags', ['$cflags', f'$cflags-{self.build_arch}'])
         ninja.variable('sflags', ['$sflags', f'$sflags-{self.build_arch}'])
+        if self.build_arch != self.top_arch:
+            # objconv only converts ELF objects, bitcode can not be passed through
+            ninja.variable('lto', '-fno-lto')
+        else:
+            ninja.variable('lto', ['$lto', f'$lto-{self.build_arch}'])
+
+        # pch is (header, include flags), a pch of the package itself uses its own includes
+        if self.build_flags.pch:
+            pch = self.package.rootdir / self.build_flags.pch, None
+        implicit = []
+        if pch:
+            # clang rejects a pch built with different flags, so every
+            # package compiles its own with its own flags
+            src, includes = pch
+            out = "$basedir/pch/" + src.name + ".pch"
+            ninja.build([out], "pch", [relative_to(src, rootdir)], variables=None if includes is None else {'includes': includes})
+            ninja.variable('pchflags', ['-include-pch', out])
+            implicit = [out]
 
         result = []
         keys = list(sorted(objs))
@@ -200,32 +326,37 @@ class Profile:
             src = objs[key]
             srcpath = relative_to(src, rootdir)
             if src.suffix == '.c':
-                ninja.build([dst], "cc", [srcpath])
+                ninja.build([dst], "cc", [srcpath], implicit)
             elif src.suffix == '.S':
                 ninja.build([dst], "as", [srcpath])
             else:
                 assert False, f"{src.suffix} file not supported"
         return result
 
-    def write_build_lib(self, rootdir, lib_ninja):
+    def write_build_lib(self, rootdir, lib_ninja, includes, pch=None, basedir=None):
+        # outputs go next to the ninja file unless basedir says otherwise
+        basedir = lib_ninja.parent if basedir is None else basedir
         with NinjaWriter(rootdir / lib_ninja) as ninja:
             self.write_build_variables(rootdir, ninja)
-            ninja.variable('basedir', lib_ninja.parent.as_posix())
-            objs = self.write_build_objs(rootdir, ninja, self.objs)
-            libname = f"lib/lib{self.id.name}.a"
+            ninja.variable('basedir', basedir.as_posix())
+            ninja.variable('includes', includes)
+            objs = self.write_build_objs(rootdir, ninja, self.write_unity(rootdir / basedir), pch)
+            libname = (basedir.parent / "lib" / f"lib{self.id.name}.a").as_posix()
             ninja.build([libname], "ar", objs)
             return libname
 
-    def write_build_bin(self, rootdir, lib_ninja):
+    def write_build_bin(self, rootdir, lib_ninja, includes, pch=None):
         with NinjaWriter(rootdir / lib_ninja) as ninja:
             self.write_build_variables(rootdir, ninja)
             ninja.variable('basedir', lib_ninja.parent.as_posix())
-            objs = self.write_build_objs(rootdir, ninja, self.elfs)
-            ninja.build(['lib/bin.a'], "ar", objs)
+            ninja.variable('includes', includes)
+            objs = self.write_build_objs(rootdir, ninja, self.elfs, pch)
+            prefix = lib_ninja.parent.parent
+            ninja.build([(prefix / 'lib/bin.a').as_posix()], "ar", objs)
             for dst in self.elfs:
                 src = "$basedir/" + dst.with_suffix(".o").as_posix()
-                elf = ('bin' / dst).as_posix()
-                ninja.build([elf], "ld", [src], ['libs', '$linker-script'])
+                elf = (prefix / 'bin' / dst).as_posix()
+                ninja.build([elf], "ld", [src], [(prefix / 'libs').as_posix(), '$linker-script'])
                 if self.build_flags.format == 'binary':
-                    bin = ('bin' / dst.with_suffix(".bin")).as_posix()
+                    bin = (prefix / 'bin' / dst.with_suffix(".bin")).as_posix()
                     ninja.build([bin], "objcopy", [elf])
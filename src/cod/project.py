@@ -6,11 +6,15 @@ import json
 from subprocess import check_call
 
 from .repo import Repo
+from . import manifest
 from .manifest import ProjectManifest, write_compiler_variables
 from .package import PackageId, Package
-from .compat import tomllib, cached_property
+from .symtab import SymbolTable
+from .compat import cached_property
 
-class ProjectLocalRepo:
+class ProjectLocalRepo(Repo):
+    # packaging on demand runs cod package in the package directory
+    max_workers = 1
 
     def __init__(self, rootdir):
         self.rootdir = rootdir
@@ -34,6 +38,13 @@ class ProjectLocalRepo:
         with path.open() as f:
             return json.load(f)
 
+    def get_symbols(self, pkgid):
+        if pkgid not in self.packages:
+            self.do_package(pkgid)
+        path = self.packages[pkgid].with_suffix(".sym")
+        if path.exists():
+            return SymbolTable.load(path)
+
     def get_path(self, pkgid):
         if pkgid not in self.packages:
             self.do_package(pkgid)
@@ -80,18 +91,19 @@ class Project:
 
     def __init__(self, pkg_dir):
         self.rootdir = find_project_dir(pkg_dir)
-        with (self.rootdir / "cod.toml").open("rb") as f:
-            toml = tomllib.load(f)
-        self.manifest = ProjectManifest.model_validate(toml)
+        self.manifest = manifest.load(self.rootdir / "cod.toml", ProjectManifest)
         self.workdir = self.rootdir / ".cod"
 
     def repodir(self, name):
         return self.workdir / name
 
+    def builddir(self, name):
+        return self.workdir / "build" / name
+
     @cached_property
     def repos(self):
         d = {
-            name: Repo(self.repodir(name), config)
+            name: Repo(self.repodir(name), dict(config))
             for name, config in self.manifest.repo.items()}
         d["local"] = ProjectLocalRepo(self.rootdir)
         return d
@@ -1,14 +1,25 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
-from .compat import entry_points
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .compat import entry_points, cached_property
+from .util import update_file
 
 repo_plugins = entry_points(group=f'{__package__}.repos')
 
 class Repo:
+    max_workers = 8
 
-    def __new__(self, cache_dir, config):
-        return object.__new__(repo_plugins[config.pop('type')].load())
+    def __new__(cls, *args):
+        if cls is not Repo:
+            return object.__new__(cls)
+        cache_dir, config = args
+        self = object.__new__(repo_plugins[config.pop('type')].load())
+        if 'max-workers' in config:
+            self.max_workers = config.pop('max-workers')
+        return self
 
     def __iter__(self):
         raise NotImplementedError
@@ -16,8 +27,90 @@ class Repo:
     def fetch(self, pkgid):
         raise NotImplementedError
 
+    def fetch_many(self, pkgids):
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            for _ in executor.map(self.fetch, pkgids):
+                pass
+
     def get_info(self, pkgid):
         raise NotImplementedError
 
+    def get_info_many(self, pkgids):
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return dict(zip(pkgids, executor.map(self.get_info, pkgids)))
+
     def get_path(self, pkgid):
         raise NotImplementedError
+
+    def get_symbols(self, pkgid):
+        return None
+
+    def get_symbols_many(self, pkgids):
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return dict(zip(pkgids, executor.map(self.get_symbols, pkgids)))
+
+
+class IndexedRepo(Repo):
+    # keeps the package index in cache_dir/index.json. Subclasses implement
+    # get_revision, get_delta and get_index, the index is revalidated once
+    # per process and only downloaded in full when no delta is available
+
+    def __init__(self, cache_dir, config):
+        self.cache_dir = cache_dir
+        self.config = config
+
+    @property
+    def index_path(self):
+        return self.cache_dir / "index.json"
+
+    def get_revision(self, etag):
+        raise NotImplementedError
+
+    def get_delta(self, revision):
+        return None
+
+    def get_index(self):
+        raise NotImplementedError
+
+    @cached_property
+    def index(self):
+        try:
+            with self.index_path.open() as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = None
+
+        try:
+            stamp = self.get_revision(index and index['etag'])
+        except OSError:
+            if index is None:
+                raise
+            return index
+
+        if stamp is None:
+            return index
+        revision, etag = stamp
+
+        if index is None or index['revision'] != revision:
+            delta = None if index is None else self.get_delta(index['revision'])
+            if delta is None:
+                packages = self.get_index()
+            else:
+                packages = index['packages']
+                for pkgid in delta.get('removed', []):
+                    packages.pop(pkgid, None)
+                packages.update(delta.get('added', {}))
+            index = {'revision': revision, 'packages': packages}
+
+        index['etag'] = etag
+        update_file(self.index_path, json.dumps(index, sort_keys=True))
+        return index
+
+    def __iter__(self):
+        return iter(self.index['packages'])
+
+    def get_info(self, pkgid):
+        return self.index['packages'][pkgid]
+
+    def get_info_many(self, pkgids):
+        return {pkgid: self.get_info(pkgid) for pkgid in pkgids}
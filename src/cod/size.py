@@ -0,0 +1,142 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from os import SEEK_SET
+from pathlib import Path
+
+from .elf import (
+    sizeof, get_elf_class,
+    SHT_SYMTAB, SHT_NOBITS, SHF_ALLOC, SHF_EXECINSTR,
+    SHN_UNDEF, SHN_LORESERVE, STB_LOCAL, STT_FILE,
+)
+
+KINDS = ("text", "data", "bss")
+UNKNOWN = "<unknown>"
+
+def get_section_kind(shdr):
+    if not shdr.sh_flags & SHF_ALLOC:
+        return None
+    if shdr.sh_type == SHT_NOBITS:
+        return "bss"
+    if shdr.sh_flags & SHF_EXECINSTR:
+        return "text"
+    return "data"
+
+def get_name(strtab, offset):
+    return strtab[offset:strtab.index(b"\0", offset)].decode()
+
+def read_symbols(path):
+    with open(path, "rb") as f:
+        Elf = get_elf_class(f)
+        f.seek(0, SEEK_SET)
+        ehdr = Elf.Ehdr.from_buffer_copy(f.read(sizeof(Elf.Ehdr)))
+
+        f.seek(ehdr.e_shoff, SEEK_SET)
+        shdrs = [Elf.Shdr.from_buffer_copy(f.read(ehdr.e_shentsize)[:sizeof(Elf.Shdr)])
+                 for _ in range(ehdr.e_shnum)]
+
+        def read(shdr):
+            f.seek(shdr.sh_offset, SEEK_SET)
+            return f.read(shdr.sh_size)
+
+        for shdr in shdrs:
+            if shdr.sh_type != SHT_SYMTAB:
+                continue
+            strtab = read(shdrs[shdr.sh_link])
+            data = read(shdr)
+            # (n, name) of the FILE symbol, the same name may be used by several translation units
+            filename = None
+            for offset in range(0, len(data), shdr.sh_entsize):
+                sym = Elf.Sym.from_buffer_copy(data, offset)
+                bind, type = sym.st_info >> 4, sym.st_info & 0xf
+                if type == STT_FILE:
+                    filename = offset, Path(get_name(strtab, sym.st_name)).name
+                    continue
+                if sym.st_shndx == SHN_UNDEF or sym.st_shndx >= SHN_LORESERVE or not sym.st_size:
+                    continue
+                kind = get_section_kind(shdrs[sym.st_shndx])
+                if kind is None:
+                    continue
+                # local symbols follow the FILE symbol of their translation unit
+                yield get_name(strtab, sym.st_name), filename if bind == STB_LOCAL else None, kind, sym.st_size
+
+def get_locals(path):
+    return {(name, size) for name, filename, _, size in read_symbols(path) if filename is not None}
+
+def match_objects(groups, objects):
+    # FILE symbols only name the source, not where it is, a group of local
+    # symbols belongs to an object of a source with that name defining them all
+    owners = {}
+    used = set()
+    for filename, names in groups.items():
+        candidates = [
+            i for i, (source, _, defined) in enumerate(objects)
+            if Path(source).name == filename[1] and names <= defined]
+        free = [i for i in candidates if i not in used]
+        if free:
+            used.add(free[0])
+            owners[filename] = objects[free[0]]
+    return owners
+
+def get_report(path, defs, objects):
+    # objects: [(package qualified source, package, local symbols of its object)]
+    entries = list(read_symbols(path))
+    groups = {}
+    for name, filename, _, size in entries:
+        if filename is not None:
+            groups.setdefault(filename, set()).add((name, size))
+    owners = match_objects(groups, objects)
+
+    packages = {}
+    symbols = {}
+    for name, filename, kind, size in entries:
+        if filename is None:
+            package = defs.get(name, UNKNOWN)
+        elif filename in owners:
+            source, package, _ = owners[filename]
+            name = f"{source}:{name}"
+        else:
+            package = UNKNOWN
+            name = f"{filename[1]}:{name}"
+        packages.setdefault(package, dict.fromkeys(KINDS, 0))[kind] += size
+        symbol = symbols.setdefault(name, {"package": package, "section": kind, "size": 0})
+        symbol["size"] += size
+    return {"packages": packages, "symbols": symbols}
+
+def diff_reports(old, new):
+    result = {}
+    for elf in sorted(set(old) | set(new)):
+        a = old.get(elf, {"packages": {}, "symbols": {}})
+        b = new.get(elf, {"packages": {}, "symbols": {}})
+
+        packages = {}
+        for name in sorted(set(a["packages"]) | set(b["packages"])):
+            x = a["packages"].get(name, {})
+            y = b["packages"].get(name, {})
+            delta = {kind: y.get(kind, 0) - x.get(kind, 0) for kind in KINDS}
+            if any(delta.values()):
+                packages[name] = delta
+
+        symbols = {}
+        for name in sorted(set(a["symbols"]) | set(b["symbols"])):
+            x = a["symbols"].get(name)
+            y = b["symbols"].get(name)
+            delta = (y["size"] if y else 0) - (x["size"] if x else 0)
+            if delta:
+                symbols[name] = {"package": (y or x)["package"], "section": (y or x)["section"], "size": delta}
+
+        result[elf] = {"packages": packages, "symbols": symbols}
+    return result
+
+def print_report(report, symbols=False, sign=False):
+    fmt = "{:+d}" if sign else "{:d}"
+    for elf, info in report.items():
+        print(elf)
+        print(f"  {'package':<40} {'text':>10} {'data':>10} {'bss':>10}")
+        for name, sizes in sorted(info["packages"].items()):
+            print(f"  {name:<40}", *(f"{fmt.format(sizes[kind]):>10}" for kind in KINDS))
+        if not symbols:
+            continue
+        print(f"  {'symbol':<40} {'section':>10} {'size':>10}  package")
+        for name, sym in sorted(info["symbols"].items(), key=lambda item: -abs(item[1]["size"])):
+            print(f"  {name:<40} {sym['section']:>10} {fmt.format(sym['size']):>10}  {sym['package']}")
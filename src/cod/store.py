@@ -0,0 +1,105 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import stat
+import tarfile
+from pathlib import Path
+from hashlib import sha256
+from shutil import rmtree
+from tempfile import TemporaryDirectory
+
+from .util import clone, get_store_dir
+
+def extract(path, fileobj):
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(path, filter='data')
+        else:
+            tar.extractall(path)
+
+def make_readonly(path):
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            os.chmod(p, stat.S_IMODE(os.lstat(p).st_mode) & ~0o222)
+
+def save_archive(fileobj, archive, digest=None):
+    # returns the sha256 of what was saved, which has to match digest when given
+    h = sha256()
+    with archive.open("wb") as f:
+        for chunk in iter(lambda: fileobj.read(65536), b""):
+            h.update(chunk)
+            f.write(chunk)
+    if digest and h.hexdigest() != digest:
+        raise ValueError(f"{archive.name}: sha256 mismatch, expected {digest}, got {h.hexdigest()}")
+    return h.hexdigest()
+
+class Store:
+    # <root>/<pkgid>/<sha256 of the package tarball>, entries are never modified,
+    # projects get views with every file reflinked or hardlinked
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, pkgid, digest):
+        return self.root / pkgid / digest
+
+    def add(self, pkgid, fileobj, digest=None):
+        (self.root / pkgid).mkdir(parents=True, exist_ok=True)
+        with TemporaryDirectory(dir=self.root / pkgid) as d:
+            archive = Path(d) / "package.tar"
+            path = self.path(pkgid, save_archive(fileobj, archive, digest))
+            if path.exists():
+                return path
+
+            tmp = Path(d) / "package"
+            with archive.open("rb") as f:
+                extract(tmp, f)
+            make_readonly(tmp)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # another process added the same content first
+                if not path.exists():
+                    raise
+        return path
+
+    def checkout(self, src, dst):
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with TemporaryDirectory(dir=dst.parent) as d:
+            tmp = Path(d) / dst.name
+            for root, dirs, files in os.walk(src):
+                target = tmp / Path(root).relative_to(src)
+                target.mkdir()
+                for name in files:
+                    clone(Path(root) / name, target / name)
+            rmtree(dst, ignore_errors=True)
+            os.rename(tmp, dst)
+
+def get_store():
+    root = get_store_dir()
+    if root is not None:
+        return Store(root)
+
+def fetch(dst, pkgid, digest, download):
+    store = get_store()
+    if store is None:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with TemporaryDirectory(dir=dst.parent) as d:
+            tmp = Path(d) / dst.name
+            archive = Path(d) / "package.tar"
+            with download() as f:
+                save_archive(f, archive, digest)
+            with archive.open("rb") as f:
+                extract(tmp, f)
+            rmtree(dst, ignore_errors=True)
+            os.rename(tmp, dst)
+        return
+
+    if digest and store.path(pkgid, digest).exists():
+        src = store.path(pkgid, digest)
+    else:
+        with download() as f:
+            src = store.add(pkgid, f, digest)
+    store.checkout(src, dst)
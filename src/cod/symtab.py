@@ -0,0 +1,121 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from struct import pack, unpack_from, calcsize
+from hashlib import blake2b, sha256
+
+# layout, all integers little endian u32
+#
+#   magic, count, number of buckets, bloom filter bits, bloom filter hashes
+#   bloom filter
+#   bucket offsets into slots (number of buckets + 1)
+#   slots, index of names grouped by bucket
+#   name offsets (count + 1)
+#   names, sorted and deduplicated
+
+MAGIC = b"CODSYM1\n"
+HEADER = "<8sIIII"
+BLOOM_BITS_PER_SYMBOL = 10
+BLOOM_HASHES = 7
+BUCKET_SIZE = 4
+
+def hash_symbol(name):
+    h = int.from_bytes(blake2b(name, digest_size=8).digest(), 'little')
+    return h & 0xFFFFFFFF, (h >> 32) | 1
+
+def build(symbols):
+    names = sorted({s.encode() for s in symbols})
+    n = len(names)
+    nbuckets = 1
+    while nbuckets * BUCKET_SIZE < n:
+        nbuckets *= 2
+    nbits = max(64, (n * BLOOM_BITS_PER_SYMBOL + 7) // 8 * 8)
+
+    bloom = bytearray(nbits // 8)
+    buckets = [[] for _ in range(nbuckets)]
+    for i, name in enumerate(names):
+        h1, h2 = hash_symbol(name)
+        for k in range(BLOOM_HASHES):
+            bit = (h1 + k * h2) % nbits
+            bloom[bit // 8] |= 1 << (bit % 8)
+        buckets[h1 & (nbuckets - 1)].append(i)
+
+    offsets = [0]
+    for bucket in buckets:
+        offsets.append(offsets[-1] + len(bucket))
+    slots = [i for bucket in buckets for i in bucket]
+
+    name_offsets = [0]
+    for name in names:
+        name_offsets.append(name_offsets[-1] + len(name))
+
+    return b"".join([
+        pack(HEADER, MAGIC, n, nbuckets, nbits, BLOOM_HASHES),
+        bytes(bloom),
+        pack(f"<{nbuckets+1}I", *offsets),
+        pack(f"<{n}I", *slots),
+        pack(f"<{n+1}I", *name_offsets),
+        b"".join(names),
+    ])
+
+class SymbolTable:
+
+    def __init__(self, data):
+        self.data = data
+        magic, self.count, self.nbuckets, self.nbits, self.nhashes = unpack_from(HEADER, data)
+        assert magic == MAGIC, "BAD MAGIC"
+        self.bloom = calcsize(HEADER)
+        self.buckets = self.bloom + self.nbits // 8
+        self.slots = self.buckets + (self.nbuckets + 1) * 4
+        self.name_offsets = self.slots + self.count * 4
+        self.names = self.name_offsets + (self.count + 1) * 4
+
+    @classmethod
+    def load(cls, path):
+        with path.open("rb") as f:
+            return cls(f.read())
+
+    @staticmethod
+    def write(path, symbols):
+        with path.open("wb") as f:
+            f.write(build(symbols))
+
+    @property
+    def digest(self):
+        return sha256(self.data).digest()
+
+    def __len__(self):
+        return self.count
+
+    def _name(self, i):
+        start, end = unpack_from("<II", self.data, self.name_offsets + i * 4)
+        return self.data[self.names+start:self.names+end]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._name(i).decode()
+
+    def might_contain(self, name):
+        return self._bloom_check(hash_symbol(name.encode()))
+
+    def _bloom_check(self, hashes):
+        h1, h2 = hashes
+        for k in range(self.nhashes):
+            bit = (h1 + k * h2) % self.nbits
+            if not self.data[self.bloom + bit // 8] & (1 << (bit % 8)):
+                return False
+        return True
+
+    def __contains__(self, name):
+        if not self.count:
+            return False
+        name = name.encode()
+        hashes = hash_symbol(name)
+        if not self._bloom_check(hashes):
+            return False
+        bucket = hashes[0] & (self.nbuckets - 1)
+        start, end = unpack_from("<II", self.data, self.buckets + bucket * 4)
+        for slot in unpack_from(f"<{end-start}I", self.data, self.slots + start * 4):
+            if self._name(slot) == name:
+                return True
+        return False
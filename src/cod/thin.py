@@ -25,10 +25,16 @@ class Header:
         assert f.read(2) == b"`\n"
         return self(name, date, uid, gid, mode, size)
 
+def read_content(f, header):
+    content = f.read(header.size)
+    if header.size % 2:
+        f.read(1)
+    return content
+
 def parse_symbols(f):
     header = Header.parse(f)
     assert header.name == b'/'
-    content = f.read(header.size)
+    content = read_content(f, header)
     n, = unpack("!I", content[0:4])
     assert content[-1] == 0
     offsets = [unpack("!I", content[4+i*4:8+i*4])[0] for i in range(n)]
@@ -40,26 +46,39 @@ def parse_symbols(f):
     assert len(names) == n
     return [(name.decode(), offset) for name, offset in zip(names, offsets)]
 
-def parse_filenames(f):
+def parse_filenames(f, thin):
+    offset = f.tell()
     header = Header.parse(f)
-    assert header.name == b'//'
-    content = f.read(header.size)
+    if header.name != b'//':
+        # regular archives only have a filename table if some name is too long
+        assert not thin
+        f.seek(offset, os.SEEK_SET)
+        return b''
+    content = read_content(f, header)
     return content
 
+def get_member_name(header, filenames):
+    if not header.name.startswith(b'/'):
+        return header.name.rstrip(b'/')
+    start = int(header.name[1:])
+    end = filenames.find(b'/\n', start)
+    assert end >= 0
+    return filenames[start:end]
+
 def parse_armap(path):
     with path.open("rb") as f:
-        assert f.read(8) == b'!<thin>\n', "BAD MAGIC"
+        magic = f.read(8)
+        assert magic in (b'!<thin>\n', b'!<arch>\n'), "BAD MAGIC"
+        thin = magic == b'!<thin>\n'
         symbols = parse_symbols(f)
-        filenames = parse_filenames(f)
+        filenames = parse_filenames(f, thin)
         names = {}
 
         for offset in set(o for _, o in symbols):
             f.seek(offset)
             header = Header.parse(f)
-            assert header.name.startswith(b'/')
-            start = int(header.name[1:])
-            end = filenames.find(b'/\n', start)
-            assert end >= 0
-            names[offset] = path.parent / filenames[start:end].decode()
+            if thin:
+                assert header.name.startswith(b'/')
+            names[offset] = path.parent / get_member_name(header, filenames).decode()
 
     return [(name, names[offset]) for name, offset in symbols]
@@ -1,6 +1,14 @@
 # Copyright (c) 2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
+import sys
+from pathlib import Path
+from shutil import copyfile
+from functools import lru_cache
+from contextlib import contextmanager
+from importlib.util import find_spec
+
 def update_file(path, new):
     try:
         f = path.open("r")
@@ -13,5 +21,88 @@ def update_file(path, new):
             return
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w") as f:
+    # replace instead of truncating, the old file may be hardlinked from the store
+    tmp = path.with_name(f"{path.name}.{os.getpid()}")
+    with tmp.open("w") as f:
         f.write(new)
+    os.replace(tmp, path)
+
+def reflink(src, dst):
+    try:
+        from fcntl import ioctl
+        FICLONE = 0x40049409
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except (ImportError, OSError):
+        return False
+
+def clone(src, dst):
+    if reflink(src, dst):
+        return
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        copyfile(src, dst)
+
+@contextmanager
+def lock_file(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as f:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            from fcntl import flock, LOCK_EX
+            flock(f.fileno(), LOCK_EX)
+        yield
+
+def parse_size(s):
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    s = s.strip().upper()
+    if s.endswith('B'):
+        s = s[:-1]
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+@lru_cache(maxsize=None)
+def get_zig():
+    # python -mziglang only execs the binary shipped in the package,
+    # running it directly saves an interpreter start per command
+    spec = find_spec('ziglang')
+    if spec is not None and spec.origin:
+        path = Path(spec.origin).parent / ("zig.exe" if os.name == 'nt' else "zig")
+        if path.is_file():
+            return [str(path)]
+    return [sys.executable, "-mziglang"]
+
+def get_cache_dir():
+    path = os.environ.get('COD_CACHE')
+    if path:
+        return Path(path).expanduser().absolute()
+
+def get_store_dir():
+    path = os.environ.get('COD_STORE')
+    if path:
+        return Path(path).expanduser().absolute()
+
+def get_stats(cachedir):
+    stats = {}
+    for name in ('hits', 'misses'):
+        try:
+            stats[name] = (cachedir / "stats" / name).stat().st_size
+        except FileNotFoundError:
+            stats[name] = 0
+
+    stats['objects'] = 0
+    stats['size'] = 0
+    for path in cachedir.glob("objects/*/*"):
+        stats['objects'] += 1
+        stats['size'] += path.stat().st_size
+    return stats
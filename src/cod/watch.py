@@ -0,0 +1,121 @@
+# Copyright (c) 2025 tanhaoqiang
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import select
+from time import sleep
+from struct import unpack_from, calcsize
+from pathlib import Path
+
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+IN_CLOEXEC     = 0o2000000
+
+IN_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT = "iIII"
+
+def is_ignored(name):
+    # .cod and cod.lock are written by the build itself, other dot files
+    # and ~ files are vcs state and editor backups
+    return name.startswith(".") or name.endswith("~") or name == "cod.lock"
+
+def walk_dirs(root):
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not is_ignored(d)]
+        yield Path(dirpath)
+
+class Inotify:
+
+    def __init__(self, roots, delay=0.05):
+        from ctypes import CDLL, get_errno
+        self.libc = CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(get_errno(), "inotify_init1 failed")
+        self.delay = delay
+        self.wds = {}
+        for root in roots:
+            self.add_tree(root)
+
+    def add_tree(self, root):
+        for path in walk_dirs(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), IN_MASK)
+            if wd >= 0:
+                self.wds[wd] = path
+
+    def read(self):
+        data = os.read(self.fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = unpack_from(EVENT, data, offset)
+            offset += calcsize(EVENT)
+            name = data[offset:offset+length].rstrip(b"\0").decode()
+            offset += length
+            yield wd, mask, name
+
+    def wait(self):
+        changes = set()
+        timeout = None
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            if not ready and changes:
+                return changes
+            for wd, mask, name in self.read():
+                if mask & IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    continue
+                if wd not in self.wds or is_ignored(name):
+                    continue
+                path = self.wds[wd] / name
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                changes.add(path)
+            # changes arrive in bursts when an editor saves, wait for them to settle
+            timeout = self.delay
+
+    def close(self):
+        os.close(self.fd)
+
+class Poller:
+
+    def __init__(self, roots, interval=0.5):
+        self.roots = roots
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        result = {}
+        for root in self.roots:
+            for path in walk_dirs(root):
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_file() and not is_ignored(entry.name):
+                            st = entry.stat()
+                            result[path / entry.name] = st.st_mtime_ns, st.st_size
+        return result
+
+    def wait(self):
+        while True:
+            sleep(self.interval)
+            snapshot = self.scan()
+            changes = {p for p in set(snapshot) | set(self.snapshot) if snapshot.get(p) != self.snapshot.get(p)}
+            self.snapshot = snapshot
+            if changes:
+                return changes
+
+    def close(self):
+        pass
+
+def get_watcher(roots):
+    try:
+        return Inotify(roots)
+    except (OSError, AttributeError, TypeError):
+        return Poller(roots)
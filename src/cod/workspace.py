@@ -1,20 +1,30 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
 import sys
 from pathlib import Path
 import json
+from hashlib import sha256
 from subprocess import check_call
+from concurrent.futures import ThreadPoolExecutor
+from shutil import rmtree
 from platform import system, machine
 
 from .project import Project
 from .package import Package, Profile
+from .manifest import BuildFlags
 from .lock import Lock
 from .thin import parse_armap
-from .dep import get_symbol_deps
+from .symtab import SymbolTable
+from . import hmap
+from .size import get_report, get_locals, diff_reports, print_report
+from .watch import get_watcher
+from .dist import get_workers
+from .dep import get_symbol_deps, is_bitcode, read_depfile
 from .ninja import NinjaWriter
 from .compat import relative_to, cached_property
-from .util import update_file
+from .util import update_file, lock_file, get_cache_dir, get_stats, get_zig
 
 def get_obj_defs(symbols):
     defs = {}
@@ -47,17 +57,114 @@ def arch_to_target(arch):
         return ["--target=x86-freestanding-none", f"-mcpu={arch}"]
     return [f"--target={arch}-freestanding-none"]
 
+# assumed peak memory of one edge, used to size pools when a memory budget is given
+COMPILE_MEMORY = 256 << 20
+HEAVY_MEMORY = 512 << 20
+LINK_MEMORY = 1 << 30
+
+def get_source_names(package):
+    # {object key: source qualified by the package}
+    rootdir = package.package.rootdir
+    names = {key.as_posix(): f"{package.id}/{src.relative_to(rootdir).as_posix()}" for key, src in package.objs.items()}
+    names.update({key.as_posix(): f"{package.id}/{key.with_suffix('.c').as_posix()}" for key in package.unity})
+    return names
+
+def get_source_name(names, obj):
+    obj = obj.as_posix()
+    for key, name in names.items():
+        if obj.endswith("/" + key):
+            return name
+
+def get_pch_exporter(scope):
+    # a translation unit can only include one pch, the one exported by a package in its include scope
+    exporters = [p for p in scope if p.export_pch]
+    if len(exporters) > 1:
+        print(f"Problem: more than one precompiled header in scope: {', '.join(str(p.export_pch) for p in exporters)}")
+        exit(1)
+    return exporters[0] if exporters else None
+
+def get_include_scopes(packages):
+    # every package only searches its own include dirs and those of the
+    # packages providing the headers it requires, transitively
+    providers = {}
+    for package in packages:
+        for key in package.includefiles:
+            providers.setdefault(f"<{key.as_posix()}>", package)
+    direct = {p: {providers[h] for h in p.requires if h in providers} for p in packages}
+
+    scopes = {}
+    for package in packages:
+        seen = {package}
+        queue = [package]
+        while queue:
+            for p in direct[queue.pop()]:
+                if p not in seen:
+                    seen.add(p)
+                    queue.append(p)
+        scopes[package] = [p for p in packages if p in seen]
+    return scopes
+
+def get_scope_packages(packages, scope):
+    # packages outside the include scope only matter when they export flags
+    return [p for p in packages if p in scope or p.export_flags != BuildFlags().normalize()]
+
+def get_scope_key(packages):
+    return [[str(p.id), [i.as_posix() for i in p.includedirs], p.export_flags.model_dump(mode='json')] for p in packages]
+
+def get_header_digest(path):
+    return sha256(path.read_bytes()).hexdigest()
+
 LIB_PROFILE='release'
 
 class Workspace:
 
-    def __init__(self, pkg_dir=None):
+    def __init__(self, pkg_dir=None, jobs=None, load_average=None, memory=None, frozen=False):
         self.pkg_dir = Path.cwd() if pkg_dir is None else Path(pkg_dir)
         self.workdir = self.pkg_dir / ".cod"
+        # build exactly what cod.lock says, without scanning, solving or probing
+        self.frozen = frozen
+        self.jobs = jobs
+        self.load_average = load_average
+        self.memory = memory
+        self.prebuilt_deps = {}
+        # the symbol resolution loop calls write_build repeatedly, only packages
+        # newly added to the lock are loaded and have their ninja files written
+        self.packages = {}
+        self.profiles = {}
+        self.written = {}
+        self.shared = {}
 
     def builddir(self, profile_name):
         return self.workdir / profile_name
 
+    def get_pool_depth(self, size):
+        depth = self.jobs or os.cpu_count() or 1
+        if self.memory is not None:
+            depth = min(depth, max(1, self.memory // size))
+        return depth
+
+    @cached_property
+    def ninja_flags(self):
+        jobs = self.jobs
+        workers = get_workers()
+        if jobs is None and workers:
+            # compiles run on the workers, keep enough edges in flight to feed them all
+            jobs = (os.cpu_count() or 1) * (len(workers) + 1)
+        elif self.memory is not None:
+            jobs = self.get_pool_depth(COMPILE_MEMORY)
+        flags = []
+        if jobs:
+            flags += ["-j", str(jobs)]
+        if self.load_average:
+            flags += ["-l", str(self.load_average)]
+        return flags
+
+    def map(self, func, items):
+        # scans and probes outside ninja share the same job budget
+        items = list(items)
+        with ThreadPoolExecutor(self.jobs) as executor:
+            return dict(zip(items, executor.map(func, items)))
+
     @cached_property
     def project(self):
         return Project(self.pkg_dir)
@@ -68,168 +175,566 @@ class Workspace:
 
     @cached_property
     def lock(self):
-        return Lock(self.pkg_dir / "cod.lock", self.project.repos)
+        return Lock(self.pkg_dir / "cod.lock", self.project.repos, self.workdir / "solver.json")
+
+    def write_globals(self, ninja):
+        # pools and phony targets can only be declared once per ninja invocation
+        ninja.pool('link', self.get_pool_depth(LINK_MEMORY))
+        ninja.pool('heavy', self.get_pool_depth(HEAVY_MEMORY))
+        ninja.build(['linker-script'], "phony")
+
+    def write_rules(self, rootdir, builddir, ninja, arch, packages):
+        target = arch_to_target(arch)
+        ninja.variable('arch', arch)
+        ninja.variable('python', [sys.executable])
+        ninja.variable('zig', get_zig())
+        ninja.variable('clang', ["$zig", "clang"])
+        ninja.variable('cc', ["$clang", "--target=${arch}-unknown-unknown"])
+        ninja.variable('ar', ["$python", f"-m{__package__}.ar"])
+        ninja.variable('objcopy', ["$python", f"-m{__package__}.objcopy"])
+        ninja.variable('objconv', ["$python", f"-m{__package__}.objconv"])
+        ninja.variable('ld', ["$zig", "cc"] + target)
+
+        cachedir = get_cache_dir()
+        workers = get_workers()
+        def cached(kind, command):
+            if cachedir is None and not (workers and kind == 'cc'):
+                return command
+            return ["$python", f"-m{__package__}.cache", str(cachedir or '-'), kind, "$in", "$out", "--"] + command
+
+        ninja.rule('cc', cached('cc', ["$cc", "$cflags", "$includes", "$lto", "$pchflags", "-MMD", "-MF", "$out.d", "-c", "$in", "-o", "$out"]), depfile="$out.d", description="CC $out")
+        ninja.rule('as', cached('cc', ["$cc", "$cflags", "$includes", "$lto", "$sflags", "-MMD", "-MF", "$out.d", "-c", "$in", "-o", "$out"]), depfile="$out.d", description="AS $out")
+        ninja.rule('pch', ["$cc", "$cflags", "$includes", "$lto", "-x", "c-header", "-MMD", "-MF", "$out.d", "$in", "-o", "$out"], depfile="$out.d", description="PCH $out", pool="heavy")
+        ninja.rule('ar', ["$ar", "$out", "$in"], description="AR $out")
+        ninja.rule('objcopy', ["$objcopy", "$out", "$in"], description="OBJCOPY $out")
+        ninja.rule('objconv', cached('objconv', ["$objconv", "$out", "$in"]), description="OBJCONV $out", pool="heavy")
+        ninja.variable('linker-script', 'linker-script')
+        ninja.rule('ld', ["$ld", "$cflags", "$lto", "$ldflags", "$linker-script-flags", "$in", "$libs", "-o", "$out"], description="LD $out", pool="link")
+
+        ninja.variable('cflags', ["-ffreestanding", "-nostdinc", "-nostdlib", "-fno-builtin"])
+
+        self.project.write_build_variables(ninja)
+
+        for package in packages:
+            lib_ninja = builddir/str(package.id)/"export.ninja"
+            if lib_ninja not in self.written:
+                with NinjaWriter(lib_ninja) as subninja:
+                    package.write_export_variables(rootdir, subninja)
+                self.written[lib_ninja] = None
+            ninja.include(lib_ninja.relative_to(rootdir))
+
+    def get_include_flags(self, rootdir, basedir, scope):
+        includedirs = [f"-I{relative_to(d, rootdir)}" for p in scope for d in p.includedirs]
+        if not self.project.manifest.project.header_map:
+            return includedirs
+        entries = {}
+        for p in scope:
+            for key, src in p.includefiles.items():
+                entries.setdefault(key.as_posix(), str(src.absolute()))
+        path = rootdir / basedir / "include.hmap"
+        hmap.write(path, entries)
+        # the include dirs stay behind the map for files it does not list
+        return [f"-I{relative_to(path, rootdir)}"] + includedirs
+
+    def get_pch(self, rootdir, basedir, scope, scopes):
+        # the pch is compiled with the flags of each package using it, but
+        # with the include scope of the package exporting it
+        exporter = get_pch_exporter(scope)
+        if exporter is None:
+            return None
+        includes = self.get_include_flags(rootdir, basedir / "pch", scopes.get(exporter, scope))
+        return exporter.export_pch, includes
+
+    def write_shared_lib(self, arch, packages, package, scopes):
+        # dependencies are built once per effective flags in the project build area without
+        # the top package, so every top package and profile with the same dependencies shares them
+        scope = scopes[package]
+        packages = get_scope_packages(packages, scope)
+        key = json.dumps([
+            str(package.id), arch,
+            package.build_flags.model_dump(mode='json'),
+            self.project.manifest.model_dump(mode='json', include={'build'}),
+            get_scope_key(packages),
+        ], sort_keys=True)
+        digest = sha256(key.encode()).hexdigest()[:16]
+
+        # the graph goes next to the outputs with paths relative to the build area, which
+        # is built by its own ninja run, so every top package shares one build log for it
+        sharedroot = self.project.workdir / "build"
+        libdir = self.project.builddir(f"{package.id}.{arch}.{digest}")
+        graph = libdir / "graph.ninja"
+        if graph not in self.written:
+            basedir = Path(libdir.name) / str(package.id)
+            with NinjaWriter(graph) as ninja:
+                self.write_rules(sharedroot, libdir, ninja, arch, packages)
+                lib_ninja = Path(libdir.name) / "lib.ninja"
+                includes = self.get_include_flags(sharedroot, basedir, scope)
+                pch = self.get_pch(sharedroot, basedir, scope, scopes)
+                lib = package.write_build_lib(sharedroot, lib_ninja, includes, pch, basedir)
+                self.written[graph] = relative_to(sharedroot / lib, self.workdir)
+                ninja.subninja(lib_ninja.as_posix())
+        return graph.relative_to(sharedroot).as_posix(), self.written[graph]
+
+    def get_profile(self, arch, pkgid, name):
+        if (pkgid, arch) not in self.profiles:
+            repo = self.project.repos[name]
+            if pkgid not in self.packages:
+                self.packages[pkgid] = Package(repo.get_path(pkgid))
+            package = Profile(self.packages[pkgid], arch, f'{LIB_PROFILE}.{pkgid.rsplit(".",1)[1]}')
+            info = repo.get_info(pkgid)
+            package.validate_headers(info.get('provides',[]))
+            package.requires = info.get('requires', [])
+            self.profiles[pkgid, arch] = package
+        return self.profiles[pkgid, arch]
+
+    def write_top(self, rootdir, lib_ninja, write, *args):
+        # rewritten when newly locked packages change its include scope or pch
+        key = rootdir / lib_ninja
+        if key not in self.written or self.written[key][0] != args:
+            self.written[key] = args, write(rootdir, lib_ninja, *args)
+        return self.written[key][1]
 
     def write_build(self, profile_name, top):
         arch = profile_name.rsplit('.', 1)[1]
 
+        if not self.frozen:
+            top.requires = top.get_includedeps(self.map)
         packages = [top]
+        self.lock.fetch(self.lock[profile_name])
         for pkgid, name in self.lock[profile_name]:
-            repo = self.project.repos[name]
-            package = Profile(Package(repo.get_path(pkgid)), arch, f'{LIB_PROFILE}.{pkgid.rsplit(".",1)[1]}')
-            package.validate_headers(repo.get_info(pkgid).get('provides',[]))
-            packages.append(package)
+            packages.append(self.get_profile(arch, pkgid, name))
         packages.sort()
 
+        # paths are relative to the work dir, so the graphs of several profiles
+        # can be loaded by one ninja invocation
+        workdir = self.workdir
         rootdir = self.builddir(profile_name)
         rootdir.mkdir(parents=True, exist_ok=True)
 
-        includedirs = []
-        for package in packages:
-            includedirs.extend(relative_to(i, rootdir) for i in package.includedirs)
-
-        with NinjaWriter(rootdir / "build.ninja") as ninja:
-            target = arch_to_target(arch)
-            ninja.variable('arch', arch)
-            ninja.variable('python', [sys.executable])
-            ninja.variable('zig', ["$python", "-mziglang"])
-            ninja.variable('clang', ["$zig", "clang"])
-            ninja.variable('cc', ["$clang", "--target=${arch}-unknown-unknown"])
-            ninja.variable('ar', ["$python", f"-m{__package__}.ar"])
-            ninja.variable('objcopy', ["$python", f"-m{__package__}.objcopy"])
-            ninja.variable('objconv', ["$python", f"-m{__package__}.objconv"])
-            ninja.variable('ld', ["$zig", "cc"] + target)
-
-            ninja.rule('cc', ["$cc", "$cflags", "-MMD", "-MF", "$out.d", "-c", "$in", "-o", "$out"], depfile="$out.d", description="CC $out")
-            ninja.rule('as', ["$cc", "$cflags", "$sflags", "-MMD", "-MF", "$out.d", "-c", "$in", "-o", "$out"], depfile="$out.d", description="AS $out")
-            ninja.rule('ar', ["$ar", "$out", "$in"], description="AR $out")
-            ninja.rule('objcopy', ["$objcopy", "$out", "$in"], description="OBJCOPY $out")
-            ninja.rule('objconv', ["$objconv", "$out", "$in"], description="OBJCONV $out")
-            ninja.variable('linker-script', 'linker-script')
-            ninja.build(['linker-script'], "phony")
-            ninja.rule('ld', ["$ld", "$cflags", "$ldflags", "$linker-script-flags", "$in", "$libs", "-o", "$out"], description="LD $out")
-
-            ninja.variable('cflags', ["-ffreestanding", "-nostdinc", "-nostdlib", "-fno-builtin"] + [f"-I{d}" for d in includedirs])
-
-            self.project.write_build_variables(ninja)
+        with NinjaWriter(rootdir / "graph.ninja") as ninja:
+            self.write_rules(workdir, rootdir, ninja, arch, packages)
 
-            for package in packages:
-                lib_ninja = rootdir/str(package.id)/"export.ninja"
-                with NinjaWriter(lib_ninja) as subninja:
-                    package.write_export_variables(rootdir, subninja)
-                ninja.include(lib_ninja.relative_to(rootdir))
-
-            libs = []
+            deps = [p for p in packages if p is not top]
+            scopes = get_include_scopes(deps)
+            # without the include scan every locked package is in scope of the top package
+            top_scope = packages if self.frozen else get_include_scopes(packages)[top]
+            libs = {}
+            shared = set()
             for package in packages:
                 if not package.objs:
                     continue
-                lib_ninja = (rootdir/str(package.id)/"lib.ninja").relative_to(rootdir)
-                libs.append(package.write_build_lib(rootdir, lib_ninja))
-                ninja.subninja(lib_ninja.as_posix())
-            ninja.build(['libs'], "phony", libs)
-            ninja.variable('libs', libs)
+                if package is top:
+                    lib_ninja = (rootdir/str(package.id)/"lib.ninja").relative_to(workdir)
+                    includes = self.get_include_flags(workdir, lib_ninja.parent, top_scope)
+                    pch = self.get_pch(workdir, lib_ninja.parent, top_scope, scopes)
+                    libs[self.write_top(workdir, lib_ninja, top.write_build_lib, includes, pch)] = package
+                    ninja.subninja(lib_ninja.as_posix())
+                    continue
+                artifact = self.find_artifact(package, deps, scopes[package])
+                if artifact is not None:
+                    libs[self.load_artifact(workdir, package, artifact)] = package
+                else:
+                    graph, lib = self.write_shared_lib(arch, deps, package, scopes)
+                    shared.add(graph)
+                    libs[lib] = package
+            ninja.build([(rootdir/"libs").relative_to(workdir).as_posix()], "phony", list(libs))
+            ninja.variable('libs', list(libs))
 
             if top.elfs:
-                lib_ninja = (rootdir/"obj"/"lib.ninja").relative_to(rootdir)
-                top.write_build_bin(rootdir, lib_ninja)
+                lib_ninja = (rootdir/"obj"/"lib.ninja").relative_to(workdir)
+                includes = self.get_include_flags(workdir, lib_ninja.parent, top_scope)
+                pch = self.get_pch(workdir, lib_ninja.parent, top_scope, scopes)
+                self.write_top(workdir, lib_ninja, top.write_build_bin, includes, pch)
                 ninja.subninja(lib_ninja.as_posix())
 
+        self.shared[profile_name] = shared
         return libs
 
-    def build(self, arch, profile_name, no_bin=False):
+    def write_entry(self, profile_names):
+        # a single profile gets its own entry and build log, so builds of different profiles can run side by side
+        path = self.workdir / (profile_names[0] if len(profile_names) == 1 else ".") / "build.ninja"
+        with NinjaWriter(path) as ninja:
+            ninja.variable('builddir', path.parent.relative_to(self.workdir).as_posix())
+            self.write_globals(ninja)
+            for profile_name in profile_names:
+                ninja.subninja((self.builddir(profile_name) / "graph.ninja").relative_to(self.workdir).as_posix())
+
+        # profiles of the same arch share dependency builds, each is loaded once
+        shared = set()
+        for profile_name in profile_names:
+            shared.update(self.shared[profile_name])
+        shared_entry = path.with_name("shared.ninja")
+        if shared:
+            with NinjaWriter(shared_entry) as ninja:
+                self.write_globals(ninja)
+                for graph in sorted(shared):
+                    ninja.subninja(graph)
+        elif shared_entry.exists():
+            shared_entry.unlink()
+        return path
+
+    def ninja(self, entry, targets=[]):
+        # the build area is shared with other top packages, its runs take turns
+        shared_entry = entry.with_name("shared.ninja")
+        if shared_entry.exists():
+            sharedroot = self.project.workdir / "build"
+            with lock_file(sharedroot / "ninja.lock"):
+                check_call([sys.executable, "-mninja", "-f", str(shared_entry.absolute())] + self.ninja_flags, cwd=sharedroot)
+        check_call([sys.executable, "-mninja", "-f", entry.relative_to(self.workdir).as_posix()] + self.ninja_flags + targets, cwd=self.workdir)
+
+    def artifact_dir(self, package, packages, scope):
+        key = json.dumps([
+            package.top_arch,
+            package.build_flags.model_dump(mode='json'),
+            self.project.manifest.model_dump(mode='json', include={'build'}),
+            package.source_digest,
+            get_scope_key(get_scope_packages(packages, scope)),
+        ], sort_keys=True)
+        digest = sha256(key.encode()).hexdigest()[:16]
+        return package.package.rootdir / ".cod" / "artifacts" / f"{package.id}.{package.build_arch}-{digest}"
+
+    def find_artifact(self, package, packages, scope):
+        # the headers of other packages the objects were compiled with are only
+        # known from the depfiles, the artifact records their digests
+        artifact = self.artifact_dir(package, packages, scope)
+        try:
+            with (artifact / "artifact.json").open() as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            return None
+        rootdirs = {str(p.id): p.package.rootdir for p in scope}
+        for pkgid, name, digest in info["headers"]:
+            path = rootdirs[pkgid] / name if pkgid in rootdirs else None
+            if path is None or not path.is_file() or get_header_digest(path) != digest:
+                return None
+        return artifact
+
+    def load_artifact(self, rootdir, package, artifact):
+        with (artifact / "artifact.json").open() as f:
+            info = json.load(f)
+        lib = relative_to(artifact / f"lib{package.id.name}.a", rootdir)
+        for member, deps in info["symbols"].items():
+            self.prebuilt_deps[(rootdir / lib).parent / member] = deps
+        return lib
+
+    def get_header_digests(self, top, scope, depfiles):
+        includedirs = [(p, Path(os.path.normpath(d))) for p in scope if p is not top for d in p.includedirs]
+        headers = {}
+        for depfile in depfiles:
+            for name in read_depfile(depfile):
+                path = Path(os.path.normpath(self.workdir / name))
+                for p, d in includedirs:
+                    if d in path.parents:
+                        headers[str(p.id), relative_to(path, p.package.rootdir)] = get_header_digest(path)
+                        break
+        return sorted([pkgid, name, digest] for (pkgid, name), digest in headers.items())
+
+    def remove_artifacts(self, top):
+        # artifacts of older sources or flags are never looked up again
+        for artifact in (top.package.rootdir / ".cod" / "artifacts").glob(f"{top.id}.{top.build_arch}-*"):
+            rmtree(artifact)
+
+    def write_artifact(self, top, profile_name):
+        rootdir = self.builddir(profile_name)
+        packages = sorted([top] + [self.get_profile(top.top_arch, pkgid, name) for pkgid, name in self.lock[profile_name]])
+        scope = get_include_scopes(packages)[top]
+        artifact = self.artifact_dir(top, packages, scope)
+        artifact.mkdir(parents=True)
+
+        objs = [rootdir / str(top.id) / key.with_suffix(".o") for key in sorted(top.write_unity(rootdir / str(top.id)))]
+        depfiles = [obj.with_name(f"{obj.name}.d") for obj in objs] + list((rootdir / str(top.id) / "pch").glob("*.d"))
+        headers = self.get_header_digests(top, scope, depfiles)
+        check_call(get_zig() + ["ar", "qcs", "--format=gnu", artifact / f"lib{top.id.name}.a"] + objs)
+
+        target = arch_to_target(top.build_arch)
+        symbols = {}
+        for obj, deps in self.map(lambda obj: get_symbol_deps(rootdir, target, obj), objs).items():
+            symbols.setdefault(obj.name, set()).update(deps)
+
+        info = {
+            "arch": top.build_arch,
+            "tag": f"{artifact.name}-{sha256(json.dumps(headers).encode()).hexdigest()[:16]}",
+            "export": top.package.manifest.model_dump(mode='json', by_alias=True, include={'export'})['export'],
+            "symbols": {name: sorted(deps) for name, deps in symbols.items()},
+            "headers": headers,
+        }
+        update_file(artifact / "artifact.json", json.dumps(info, sort_keys=True))
+
+    def get_symbol_deps(self, rootdir, target, obj):
+        if obj in self.prebuilt_deps:
+            return self.prebuilt_deps[obj]
+        return get_symbol_deps(rootdir, target, obj)
+
+    def get_arch(self, arch):
         if arch is None:
             arch = get_native_arch()
             if self.top_package.arch and len(self.top_package.arch) == 1:
                 arch = self.top_package.arch[0]
         assert arch in (self.top_package.arch or (arch,))
+        return arch
+
+    def get_link_closure(self, profile_name, top, libs):
+        # returns the symbols the bins leave undefined and the libs they pull objects from
+        workdir = self.workdir
+        target = arch_to_target(top.top_arch)
+        bin_defs = get_obj_defs(parse_armap(self.builddir(profile_name) / "lib/bin.a"))
+        symbols = {}
+        members = {}
+        for lib in libs:
+            for symbol, obj in parse_armap(workdir / lib):
+                symbols[symbol] = obj
+                members[obj] = lib
+        deps = self.map(lambda obj: self.get_symbol_deps(workdir, target, obj), set(symbols.values()) | set(bin_defs))
+
+        undefined = set()
+        linked = set()
+
+        for obj, defs in bin_defs.items():
+            queue = []
+            queue.extend(deps[obj])
+            while queue:
+                symbol = queue.pop(0)
+                if symbol in undefined:
+                    continue
+                if symbol in defs:
+                    continue
+                if symbol in symbols:
+                    defs.add(symbol)
+                    linked.add(members[symbols[symbol]])
+                    queue.extend(deps[symbols[symbol]])
+                else:
+                    undefined.add(symbol)
+
+        return undefined, linked
+
+    def resolve_symbols(self, profile_name, undefined):
+        # returns whether packages were added to the lock
+        provides = {f"({s})" for s in undefined}
+        with self.lock(profile_name):
+            self.lock.install_provides(provides)
+            return self.lock.dirty
 
-        profile_name = f'{profile_name}.{arch}'
-        top = Profile(self.top_package, arch, profile_name)
+    def prune(self, profile_name, top, linked):
+        # keeps the locked packages the sources include headers from or link objects
+        # from, and what those include in turn, returns whether any were dropped
+        arch = profile_name.rsplit('.', 1)[1]
+        locked = {self.get_profile(arch, pkgid, name): (pkgid, name) for pkgid, name in self.lock[profile_name]}
+        scopes = get_include_scopes([top] + list(locked))
+        # flags, linker scripts and packages with neither headers nor objects
+        # act on the build in ways not visible here, they are kept
+        needed = {p for p in locked if p.export_flags != BuildFlags().normalize() or not (p.includefiles or p.objs)}
+        for package in [top] + linked:
+            needed.update(scopes[package])
+        return self.lock.retain(profile_name, [locked[p] for p in locked if p in needed])
+
+    def get_tops(self, archs, profile_names):
+        tops = {}
+        for profile_name in profile_names:
+            for arch in archs:
+                arch = self.get_arch(arch)
+                name = f'{profile_name}.{arch}'
+                tops[name] = top = Profile(self.top_package, arch, name)
+                if self.frozen:
+                    # a profile without a section simply has no dependencies
+                    assert self.lock.path.exists(), "cod.lock not found, run cod build without --frozen first"
+                    continue
+
+                includedeps = top.get_includedeps(self.map)
+                if includedeps:
+                    with self.lock(name):
+                        self.lock.install_provides(includedeps)
+        return tops
+
+    def resolve(self, tops, prune=False):
+        # builds what symbol resolution needs until the lock covers every profile,
+        # returns the entry for the final build
+        assert not (prune and self.frozen), "--prune needs to scan the sources, it cannot be used with --frozen"
+        libs = {name: self.write_build(name, top) for name, top in tops.items()}
+        entry = self.write_entry(list(tops))
+
+        pending = [] if self.frozen else [name for name, top in tops.items() if top.elfs]
+        linked = {}
+        while pending:
+            # one ninja run builds what symbol resolution needs for every profile
+            targets = [(self.builddir(name) / "lib/bin.a").relative_to(self.workdir).as_posix() for name in pending]
+            self.ninja(entry, targets + [lib for name in pending for lib in libs[name]])
+            for name in list(pending):
+                undefined, linked[name] = self.get_link_closure(name, tops[name], libs[name])
+                if undefined and self.resolve_symbols(name, undefined):
+                    libs[name] = self.write_build(name, tops[name])
+                else:
+                    pending.remove(name)
+            entry = self.write_entry(list(tops))
+
+        if not prune:
+            return entry
+
+        for name, top in tops.items():
+            # without bins there is no link to tell which libs are used, all are kept
+            used = [libs[name][lib] for lib in linked[name]] if name in linked else list(libs[name].values())
+            if self.prune(name, top, used):
+                self.write_build(name, top)
+        return self.write_entry(list(tops))
+
+    def build(self, arch, profile_name, no_bin=False):
+        self.build_matrix([arch], [profile_name], no_bin)
+
+    def build_matrix(self, archs, profile_names, no_bin=False, prune=False):
+        tops = self.get_tops(archs, profile_names)
+        if no_bin:
+            targets = [lib for name, top in tops.items() for lib in self.write_build(name, top)]
+            if targets:
+                self.ninja(self.write_entry(list(tops)), targets)
+            return
 
-        if top.includedeps:
-            with self.lock(profile_name):
-                self.lock.install_provides(top.includedeps)
+        self.ninja(self.resolve(tops, prune))
 
+    def update_lock(self, archs, profile_names, prune=False):
+        self.resolve(self.get_tops(archs, profile_names), prune)
+
+    def size(self, arch, profile_name, json_output=False, symbols=False, diff=None):
+        arch = self.get_arch(arch)
+        profile_name = f'{profile_name}.{arch}'
+        top = Profile(self.top_package, arch, profile_name)
         rootdir = self.builddir(profile_name)
 
+        assert top.elfs, f"package {top.id} has no executables"
+        elfs = ['bin' / dst for dst in sorted(top.elfs)]
+        for elf in elfs:
+            assert (rootdir / elf).exists(), f"{elf.as_posix()} not built, run cod build first"
+
         libs = self.write_build(profile_name, top)
-        if no_bin or not top.elfs:
-            if libs:
-                check_call([sys.executable, "-mninja"] + libs, cwd=rootdir)
+        defs = {}
+        objs = {}
+        for lib, package in libs.items():
+            for name, obj in parse_armap(self.workdir / lib):
+                defs.setdefault(name, str(package.id))
+                objs[obj] = package
+        for name, _ in parse_armap(rootdir / "lib/bin.a"):
+            defs.setdefault(name, str(top.id))
+        sources = {
+            rootdir / "obj" / key.with_suffix(".o"): f"{top.id}/{src.relative_to(top.package.rootdir).as_posix()}"
+            for key, src in top.elfs.items()}
+
+        names = {}
+        for obj, package in objs.items():
+            if package not in names:
+                names[package] = get_source_names(package)
+            sources[obj] = get_source_name(names[package], obj) or f"{package.id}/{obj.name}"
+
+        objects = []
+        for obj, source in sources.items():
+            if not obj.exists() or is_bitcode(obj):
+                continue
+            package = objs.get(obj, top)
+            objects.append((source, str(package.id), get_locals(obj)))
+
+        report = {elf.as_posix(): get_report(rootdir / elf, defs, objects) for elf in elfs}
+
+        if diff is not None:
+            with open(diff) as f:
+                report = diff_reports(json.load(f), report)
+
+        if json_output:
+            json.dump(report, sys.stdout, indent=2, sort_keys=True)
+            print()
+        else:
+            print_report(report, symbols, diff is not None)
+
+    def reset(self):
+        for name in ('project', 'top_package', 'lock'):
+            self.__dict__.pop(name, None)
+        self.prebuilt_deps.clear()
+        self.packages.clear()
+        self.profiles.clear()
+        self.written.clear()
+        self.shared.clear()
+
+    def invalidate(self, paths):
+        if any(path.name == "cod.toml" for path in paths):
+            self.reset()
             return
 
-        target = arch_to_target(arch)
-
-        while True:
-            check_call([sys.executable, "-mninja", "lib/bin.a"] + libs, cwd=rootdir)
-            bin_defs = get_obj_defs(parse_armap(rootdir / "lib/bin.a"))
-            symbols = dict(sum((parse_armap(rootdir / lib) for lib in libs), []))
-            lib_deps = {lib: get_symbol_deps(rootdir, target, lib) for lib in set(symbols.values())}
-
-            undefined = set()
-
-            for obj, defs in bin_defs.items():
-                queue = []
-                queue.extend(get_symbol_deps(rootdir, target, obj))
-                while queue:
-                    symbol = queue.pop(0)
-                    if symbol in undefined:
-                        continue
-                    if symbol in defs:
-                        continue
-                    if symbol in symbols:
-                        defs.add(symbol)
-                        queue.extend(lib_deps[symbols[symbol]])
-                    else:
-                        undefined.add(symbol)
-
-            if not undefined:
-                break
-
-            provides = {f"({s})" for s in undefined}
-            with self.lock(profile_name):
-                self.lock.install_provides(provides)
-                if not self.lock.dirty:
-                    break
-            libs = self.write_build(profile_name, top)
-
-        check_call([sys.executable, "-mninja"], cwd=rootdir)
+        for package in [self.top_package] + list(self.packages.values()):
+            changed = {path for path in paths if package.rootdir in path.parents}
+            if not changed or not package.invalidate(changed):
+                continue
+            if package is not self.top_package:
+                # headers and symbols of a dependency changed, resolve from scratch
+                self.reset()
+                return
+            for key in list(self.written):
+                if key.name == "lib.ninja" and key.parent.parent.parent == self.workdir:
+                    del self.written[key]
+
+    def watch(self, archs, profile_names, prune=False):
+        watcher = get_watcher([self.project.rootdir])
+        try:
+            while True:
+                try:
+                    self.build_matrix(archs, profile_names, prune=prune)
+                except (Exception, SystemExit) as e:
+                    print(f"cod: build failed: {e!r}", file=sys.stderr)
+                print("cod: watching for changes", file=sys.stderr)
+                self.invalidate(watcher.wait())
+        finally:
+            watcher.close()
 
     def install(self, arch, profile_name, packages):
-        if arch is None:
-            arch = get_native_arch()
-            if self.top_package.arch and len(self.top_package.arch) == 1:
-                arch = self.top_package.arch[0]
-        assert arch in (self.top_package.arch or (arch,))
+        arch = self.get_arch(arch)
         profile_name = f'{profile_name}.{arch}'
         with self.lock(profile_name):
             self.lock.install_packages(packages)
 
-    def package(self, arch):
+    def package(self, arch, artifact=False):
         if arch is None:
             for arch in self.top_package.arch or (get_native_arch(),):
-                self.package(arch)
+                self.package(arch, artifact)
             return
         assert arch in (self.top_package.arch or (arch,))
 
         profile_name = f"{LIB_PROFILE}.{arch}"
         top = Profile(self.top_package, arch, profile_name)
+        # the include scope of the top package goes into the artifact key
+        top.requires = top.get_includedeps(self.map)
         info = {
-            "requires": list(top.includedeps),
+            "requires": list(top.requires),
             "provides": [f"<{h.as_posix()}>" for h in top.includefiles],
         }
 
         if top.export_flags.linker_script:
             info["provides"].append("{linker-script}")
 
+        # consumers use the artifact when it exists, one left from an earlier
+        # cod package --artifact would stand in for what is built now
+        self.remove_artifacts(top)
         if top.objs:
             self.build(arch, LIB_PROFILE, no_bin=True)
             libname = f"lib{top.id.name}.a"
             symbols = parse_armap(self.builddir(profile_name)/"lib"/libname)
             info["provides"].append(libname)
-            info["provides"].extend(f"({s})" for s, _ in symbols)
+            SymbolTable.write(self.workdir / f"{top.id}.sym", (s for s, _ in symbols))
+            if artifact:
+                self.write_artifact(top, profile_name)
 
         info["requires"].sort()
         info["provides"].sort()
 
+        if not top.objs:
+            try:
+                (self.workdir / f"{top.id}.sym").unlink()
+            except FileNotFoundError:
+                pass
+
         update_file(self.workdir / f"{top.id}.cod", json.dumps(info, sort_keys=True))
+
+    def cache_stats(self):
+        cachedir = get_cache_dir()
+        assert cachedir is not None, "compile cache not enabled, set COD_CACHE"
+        stats = get_stats(cachedir)
+        total = stats['hits'] + stats['misses']
+        rate = stats['hits'] * 100 / total if total else 0
+        print(f"cache directory: {cachedir}")
+        print(f"hits:    {stats['hits']} ({rate:.1f}%)")
+        print(f"misses:  {stats['misses']}")
+        print(f"objects: {stats['objects']} ({stats['size']} bytes)")
@@ -1,6 +1,8 @@
 # Copyright (c) 2024-2025 tanhaoqiang
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import os
+import sys
 import unittest
 from pathlib import Path
 from subprocess import call
@@ -13,6 +15,9 @@ class Case(unittest.TestCase):
         for path in self.rootdir.glob("*/.cod/*.cod"):
             path.unlink()
 
+        for path in self.rootdir.glob("*/.cod/*.sym"):
+            path.unlink()
+
         for path in self.rootdir.glob("*/cod.lock"):
             path.unlink()
 
@@ -22,6 +27,453 @@ class Case(unittest.TestCase):
     def assertCodFail(self, directory, *args):
         self.assertNotEqual(0, call(("cod",)+args, cwd=self.rootdir/directory))
 
+class TestSymbolTable(unittest.TestCase):
+
+    def test_lookup(self):
+        from cod.symtab import SymbolTable, build
+        symbols = [f"sym{i}" for i in range(1000)]
+        table = SymbolTable(build(symbols + symbols[:10]))
+        self.assertEqual(len(table), 1000)
+        self.assertEqual(list(table), sorted(symbols))
+        for symbol in symbols:
+            self.assertIn(symbol, table)
+        for i in range(1000):
+            self.assertNotIn(f"other{i}", table)
+        self.assertNotIn("sym", SymbolTable(build([])))
+
+class TestManifestCache(unittest.TestCase):
+
+    def test_load(self):
+        from tempfile import TemporaryDirectory
+        from cod import manifest
+        with TemporaryDirectory() as d:
+            path = Path(d) / "cod.toml"
+            path.write_text('[package]\nname = "a"\nversion = "1"\n')
+            a = manifest.load(path, manifest.PackageManifest)
+            self.assertIs(a, manifest.load(path, manifest.PackageManifest))
+
+            (path.parent / ".cod").mkdir()
+            manifest._loaded.clear()
+            manifest.load(path, manifest.PackageManifest)
+            cache = path.parent / ".cod" / "PackageManifest.json"
+            self.assertTrue(cache.exists())
+            manifest._loaded.clear()
+            self.assertEqual(a, manifest.load(path, manifest.PackageManifest))
+
+            # a broken cache is a miss
+            cache.write_text('{"stamp": [], "data": ')
+            manifest._loaded.clear()
+            self.assertEqual(a, manifest.load(path, manifest.PackageManifest))
+
+            path.write_text('[package]\nname = "b"\nversion = "10"\n')
+            self.assertEqual("b", manifest.load(path, manifest.PackageManifest).package.name)
+
+class TestScanFiles(unittest.TestCase):
+
+    def test_scan(self):
+        from tempfile import TemporaryDirectory
+        from cod.package import scan_files
+        with TemporaryDirectory() as d:
+            rootdir = Path(d)
+            (rootdir / ".cod").mkdir()
+            (rootdir / "src" / "a").mkdir(parents=True)
+            (rootdir / "src" / "a" / "x.c").touch()
+            self.assertEqual(['x.c'], scan_files(rootdir)["src/a"][1])
+            self.assertTrue((rootdir / ".cod" / "files.json").exists())
+            (rootdir / "src" / "a" / "y.c").touch()
+            self.assertEqual(['x.c', 'y.c'], scan_files(rootdir)["src/a"][1])
+
+class TestLimits(unittest.TestCase):
+
+    def test_parse_size(self):
+        from cod.util import parse_size
+        self.assertEqual(parse_size("4096"), 4096)
+        self.assertEqual(parse_size("512M"), 512 << 20)
+        self.assertEqual(parse_size("1.5GB"), 3 << 29)
+
+    def test_pool_depth(self):
+        from cod.workspace import Workspace, LINK_MEMORY
+        ws = Workspace(jobs=8, load_average=4, memory=2 * LINK_MEMORY)
+        self.assertEqual(ws.get_pool_depth(LINK_MEMORY), 2)
+        self.assertEqual(ws.ninja_flags, ["-j", "8", "-l", "4"])
+        ws = Workspace(jobs=8, memory=1)
+        self.assertEqual(ws.get_pool_depth(LINK_MEMORY), 1)
+        self.assertEqual(ws.ninja_flags, ["-j", "1"])
+
+class TestZig(unittest.TestCase):
+
+    def test_get_zig(self):
+        from subprocess import check_output
+        from cod.compat import version
+        from cod.util import get_zig
+        self.assertEqual(version('ziglang'), check_output(get_zig() + ["version"], text=True).strip())
+
+class TestFetchMany(unittest.TestCase):
+
+    def test_fetch(self):
+        import json
+        from time import sleep
+        from threading import Lock as Mutex
+        from tempfile import TemporaryDirectory
+        from shutil import copytree
+        from cod.repo import Repo
+        from cod.lock import Lock
+
+        class DirRepo(Repo):
+            max_workers = 4
+
+            def __init__(self, source, cache_dir):
+                self.source = source
+                self.cache_dir = cache_dir
+                self.mutex = Mutex()
+                self.running = 0
+                self.peak = 0
+
+            def __iter__(self):
+                return (path.stem for path in self.source.glob("*.cod"))
+
+            def fetch(self, pkgid):
+                with self.mutex:
+                    self.running += 1
+                    self.peak = max(self.peak, self.running)
+                sleep(0.1)
+                copytree(self.source / pkgid, self.cache_dir / pkgid)
+                with self.mutex:
+                    self.running -= 1
+
+            def get_info(self, pkgid):
+                return json.loads((self.source / f"{pkgid}.cod").read_text())
+
+        with TemporaryDirectory() as d:
+            d = Path(d)
+            pkgids = [f"p{i}-1.0-0.noarch" for i in range(8)]
+            for pkgid in pkgids:
+                (d / "source" / pkgid).mkdir(parents=True)
+                (d / "source" / f"{pkgid}.cod").write_text(json.dumps({"provides": [f"<p{pkgid[1]}.h>"]}))
+            repo = DirRepo(d / "source", d / "cache")
+            self.assertEqual(set(pkgids), set(repo.get_info_many(pkgids)))
+
+            lock = Lock(d / "cod.lock", {"dir": repo})
+            with lock("dev.x86_64"):
+                lock.install_provides([f"<p{i}.h>" for i in range(8)])
+            packages = lock["dev.x86_64"]
+            self.assertEqual(8, len(packages))
+            lock.fetch(packages)
+            lock.fetch(packages)
+            self.assertEqual(set(pkgids), {path.name for path in (d / "cache").iterdir()})
+            self.assertEqual(4, repo.peak)
+
+class TestSolverMemo(unittest.TestCase):
+
+    def test_replay(self):
+        import json
+        from tempfile import TemporaryDirectory
+        from cod.repo import Repo
+        from cod.lock import Lock
+
+        class DictRepo(Repo):
+
+            def __init__(self, infos):
+                self.infos = infos
+
+            def __iter__(self):
+                return iter(self.infos)
+
+            def get_info(self, pkgid):
+                return self.infos[pkgid]
+
+        def no_solver(jobs):
+            raise AssertionError("solver called")
+
+        infos = {
+            "a-1.0-0.noarch": {"provides": ["<a.h>"], "requires": ["<b.h>"]},
+            "b-1.0-0.noarch": {"provides": ["<b.h>"]},
+        }
+        with TemporaryDirectory() as d:
+            d = Path(d)
+            memo = d / "solver.json"
+            lock = Lock(d / "1.lock", {"dir": DictRepo(infos)}, memo)
+            with lock("dev.x86_64"):
+                lock.install_provides(["<a.h>"])
+            packages = lock["dev.x86_64"]
+            self.assertEqual(2, len(packages))
+
+            lock = Lock(d / "2.lock", {"dir": DictRepo(infos)}, memo)
+            lock.install = no_solver
+            with lock("dev.x86_64"):
+                lock.install_provides(["<a.h>"])
+                # already provided by the installed packages
+                lock.install_provides(["<b.h>"])
+            self.assertEqual(sorted(packages), sorted(lock["dev.x86_64"]))
+
+            # results for other repo contents are dropped
+            infos["c-1.0-0.noarch"] = {"provides": ["<c.h>"]}
+            lock = Lock(d / "3.lock", {"dir": DictRepo(infos)}, memo)
+            self.assertEqual({}, lock.memo)
+            with lock("dev.x86_64"):
+                lock.install_provides(["<a.h>"])
+            self.assertEqual(1, len(json.loads(memo.read_text())["results"]))
+
+class TestSymbolConflicts(unittest.TestCase):
+
+    def test_avoid(self):
+        from tempfile import TemporaryDirectory
+        from cod.repo import Repo
+        from cod.lock import Lock
+        from cod.symtab import SymbolTable, build
+
+        class SymbolRepo(Repo):
+
+            def __init__(self, symbols):
+                self.symbols = symbols
+                self.fetched = []
+
+            def __iter__(self):
+                return iter(self.symbols)
+
+            def get_info(self, pkgid):
+                return {}
+
+            def get_symbols(self, pkgid):
+                return SymbolTable(build(self.symbols[pkgid]))
+
+            def get_symbols_many(self, pkgids):
+                self.fetched.append(sorted(pkgids))
+                return super().get_symbols_many(pkgids)
+
+        repo = SymbolRepo({
+            "a-1.0-0.noarch": ["x"],
+            "b-1.0-0.noarch": ["x", "y"],
+            "c-1.0-0.noarch": ["y"],
+        })
+        with TemporaryDirectory() as d:
+            lock = Lock(Path(d) / "cod.lock", {"dir": repo})
+            with lock("dev.x86_64"):
+                lock.install_packages(["a"])
+                # b also provides y but conflicts with a on x
+                lock.install_from_symbols(["y"])
+            self.assertEqual(["a-1.0-0.noarch", "c-1.0-0.noarch"], sorted(p for p, _ in lock["dev.x86_64"]))
+        # the symbols of all packages are fetched in one batch
+        self.assertEqual([["a-1.0-0.noarch", "b-1.0-0.noarch", "c-1.0-0.noarch"]], repo.fetched)
+
+class TestLockedProfiles(unittest.TestCase):
+
+    def test_no_pool(self):
+        from tempfile import TemporaryDirectory
+        from cod.lock import Lock
+        class UnusedRepo:
+            def __iter__(self):
+                raise AssertionError("repo listed")
+        with TemporaryDirectory() as d:
+            path = Path(d) / "cod.lock"
+            path.write_text("[dev.x86_64]\na-1.0-0.noarch = dir\n")
+            lock = Lock(path, {"dir": UnusedRepo()})
+            self.assertEqual([("a-1.0-0.noarch", "dir")], lock["dev.x86_64"])
+            self.assertNotIn("pool", lock.__dict__)
+
+def serve_repo(served, requests):
+    from hashlib import sha256
+    from threading import Thread
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            path = served / self.path.lstrip("/")
+            if not path.is_file():
+                self.send_error(404)
+                return
+            data = path.read_bytes()
+            etag = '"' + sha256(data).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def publish_repo(d, revision, packages, delta=None):
+    import json
+    import tarfile
+    from hashlib import sha256
+    served = d / "served"
+    (served / "delta").mkdir(parents=True, exist_ok=True)
+    (served / "packages").mkdir(exist_ok=True)
+    for pkgid, info in packages.items():
+        src = d / "src" / pkgid
+        if not src.exists():
+            (src / "include").mkdir(parents=True)
+            (src / "include" / f"{pkgid[0]}.h").touch()
+            with tarfile.open(served / "packages" / f"{pkgid}.tar", "w") as tar:
+                tar.add(src, arcname=".")
+        info["sha256"] = sha256((served / "packages" / f"{pkgid}.tar").read_bytes()).hexdigest()
+    (served / "revision").write_text(revision)
+    (served / "index.json").write_text(json.dumps(packages))
+    if delta:
+        (served / "delta" / f"{delta[0]}.json").write_text(json.dumps(delta[1]))
+
+class TestHttpRepo(unittest.TestCase):
+
+    def test_refresh(self):
+        from tempfile import TemporaryDirectory
+        from cod.httprepo import HttpRepo
+
+        with TemporaryDirectory() as d:
+            d = Path(d)
+            requests = []
+            server = serve_repo(d / "served", requests)
+            url = f"http://127.0.0.1:{server.server_port}"
+            try:
+                a = {"a-1.0-0.noarch": {"provides": ["<a.h>"]}}
+                publish_repo(d, "1", a)
+                repo = HttpRepo(d / "cache", {"url": url})
+                self.assertEqual(list(a), list(repo))
+                repo.fetch_many(list(a))
+                self.assertTrue((repo.get_path("a-1.0-0.noarch") / "include" / "a.h").exists())
+                self.assertIsNone(repo.get_symbols("a-1.0-0.noarch"))
+
+                del requests[:]
+                repo = HttpRepo(d / "cache", {"url": url})
+                self.assertEqual(a, repo.get_info_many(list(repo)))
+                self.assertIsNone(repo.get_symbols("a-1.0-0.noarch"))
+                self.assertEqual(["/revision"], requests)
+
+                b = {"b-1.0-0.noarch": {"provides": ["<b.h>"]}}
+                publish_repo(d, "2", {**a, **b}, ("1", {"added": b}))
+                del requests[:]
+                repo = HttpRepo(d / "cache", {"url": url})
+                self.assertEqual({**a, **b}, repo.get_info_many(list(repo)))
+                self.assertEqual(["/revision", "/delta/1.json"], requests)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+class TestWorkerArgv(unittest.TestCase):
+
+    def test_check(self):
+        from cod.dist import check_argv
+        argv = ["--target=x86_64-unknown-unknown", "-ffreestanding", "-O2", "-g", "-DA=1", "-D", "B", "-Wall", "-flto=thin"]
+        self.assertEqual(argv, check_argv(argv))
+        for argv in (["-Xclang", "-load"], ["-fplugin=x.so"], ["-B/tmp"], ["-Wl,-x"], ["-mllvm", "-x"], ["-D"]):
+            with self.assertRaises(ValueError):
+                check_argv(argv)
+
+    def test_version(self):
+        from threading import Thread, Semaphore
+        from cod.dist import Server, Handler, request
+        from cod.compat import version
+        with Server(('127.0.0.1', 0), Handler) as server:
+            server.slots = Semaphore(1)
+            Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                header = {"argv": [], "lang": "cpp-output", "version": version('ziglang') + "-other"}
+                response, _ = request(server.server_address[:2], header, b"")
+                self.assertIsNone(response['returncode'])
+            finally:
+                server.shutdown()
+
+class TestStore(unittest.TestCase):
+
+    def test_checkout(self):
+        from tempfile import TemporaryDirectory
+        from cod.httprepo import HttpRepo
+
+        with TemporaryDirectory() as d:
+            d = Path(d)
+            requests = []
+            server = serve_repo(d / "served", requests)
+            url = f"http://127.0.0.1:{server.server_port}"
+            os.environ["COD_STORE"] = str(d / "store")
+            try:
+                publish_repo(d, "1", {"a-1.0-0.noarch": {"provides": ["<a.h>"]}})
+                views = []
+                for project in ("p1", "p2"):
+                    repo = HttpRepo(d / project, {"url": url})
+                    repo.fetch("a-1.0-0.noarch")
+                    views.append(repo.get_path("a-1.0-0.noarch") / "include" / "a.h")
+                self.assertEqual(1, requests.count("/packages/a-1.0-0.noarch.tar"))
+                self.assertTrue(all(view.exists() for view in views))
+                self.assertEqual(1, len(list((d / "store" / "a-1.0-0.noarch").iterdir())))
+
+                # a download not matching the index is not stored
+                publish_repo(d, "2", {"b-1.0-0.noarch": {}})
+                with (d / "served" / "packages" / "b-1.0-0.noarch.tar").open("ab") as f:
+                    f.write(b"\0" * 512)
+                repo = HttpRepo(d / "p3", {"url": url})
+                with self.assertRaises(ValueError):
+                    repo.fetch("b-1.0-0.noarch")
+                self.assertEqual([], list((d / "store" / "b-1.0-0.noarch").iterdir()))
+            finally:
+                del os.environ["COD_STORE"]
+                server.shutdown()
+                server.server_close()
+
+class TestWatch(unittest.TestCase):
+
+    def check_watcher(self, watcher):
+        from threading import Timer
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            d = Path(d)
+            (d / "src").mkdir()
+            w = watcher([d])
+            Timer(0.2, (d / "src" / "a.c").touch).start()
+            try:
+                self.assertIn(d / "src" / "a.c", w.wait())
+            finally:
+                w.close()
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is linux only")
+    def test_inotify(self):
+        from cod.watch import Inotify
+        self.check_watcher(Inotify)
+
+    def test_poller(self):
+        from cod.watch import Poller
+        self.check_watcher(Poller)
+
+    def test_build(self):
+        from time import sleep, monotonic
+        from shutil import copytree
+        from subprocess import Popen, DEVNULL
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as d:
+            rootdir = Path(d) / "project"
+            copytree(Path(__file__).parent / "include-dependency", rootdir)
+            self.assertEqual(0, call(("cod", "package"), cwd=rootdir/"lib"))
+
+            def wait_for(check):
+                deadline = monotonic() + 120
+                while not check():
+                    self.assertLess(monotonic(), deadline)
+                    sleep(0.1)
+
+            def elf():
+                return next((rootdir / "bin" / ".cod").glob("dev.*/bin/id.elf"), None)
+
+            proc = Popen(("cod", "build", "--watch"), cwd=rootdir/"bin", stdout=DEVNULL, stderr=DEVNULL)
+            try:
+                wait_for(lambda: elf() is not None)
+                mtime = elf().stat().st_mtime_ns
+                sleep(0.5)
+                with (rootdir / "bin" / "bin" / "id.c").open("a") as f:
+                    f.write("\nint watched;\n")
+                wait_for(lambda: elf().stat().st_mtime_ns != mtime)
+                self.assertIsNone(proc.poll())
+            finally:
+                proc.terminate()
+                proc.wait()
+
 class TestIncludeDependency(Case):
     directory = 'include-dependency'
 
@@ -211,3 +663,271 @@ class TestProjectLocalRepo(Case):
         rmtree(self.rootdir / "bin" / ".cod")
 
         self.assertCodOk("bin", "build")
+
+class TestCompileCache(Case):
+    directory = 'compile-cache'
+
+    def test_build(self):
+        cachedir = self.rootdir / ".cache"
+        rmtree(cachedir, ignore_errors=True)
+        rmtree(self.rootdir / "lib" / ".cod", ignore_errors=True)
+        os.environ["COD_CACHE"] = str(cachedir)
+        try:
+            self.assertCodOk("lib", "build")
+            rmtree(self.rootdir / "lib" / ".cod")
+            self.assertCodOk("lib", "build")
+            for depfile in (self.rootdir / "lib" / ".cod").glob("**/*.o.d"):
+                self.assertFalse(depfile.read_text().startswith("-:"))
+                # restored objects do not share their inode with the cache
+                self.assertEqual(1, depfile.with_suffix("").stat().st_nlink)
+            # a no-op build after hits does not run the edges again
+            self.assertCodOk("lib", "build")
+            self.assertCodOk("lib", "cache")
+        finally:
+            del os.environ["COD_CACHE"]
+        self.assertEqual((cachedir / "stats" / "misses").stat().st_size, 2)
+        self.assertEqual((cachedir / "stats" / "hits").stat().st_size, 2)
+
+class TestDistributedBuild(Case):
+    directory = 'multiple-objects'
+
+    def test_build(self):
+        from subprocess import Popen, PIPE
+        rmtree(self.rootdir / "lib" / ".cod", ignore_errors=True)
+        workers = [Popen(("cod", "worker"), stdout=PIPE, text=True) for _ in range(3)]
+        try:
+            addresses = [w.stdout.readline().split()[-1] for w in workers]
+            os.environ["COD_WORKERS"] = ",".join(addresses)
+            try:
+                self.assertCodOk("lib", "build")
+            finally:
+                del os.environ["COD_WORKERS"]
+        finally:
+            for w in workers:
+                w.terminate()
+        compiled = sum(w.communicate()[0].count("compiled") for w in workers)
+        self.assertEqual(2, compiled)
+
+class TestSharedBuild(Case):
+    directory = 'shared-build'
+
+    def test_build(self):
+        from subprocess import check_output
+        rmtree(self.rootdir / ".cod", ignore_errors=True)
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("bin1", "build")
+        # the dependency built for bin1 is up to date for bin2
+        output = check_output(("cod", "build"), cwd=self.rootdir / "bin2", text=True)
+        self.assertNotIn("sb.o", output)
+        self.assertCodOk("bin1", "build", "-p", "release")
+        self.assertEqual(len(list(self.rootdir.glob(".cod/build/lib-*"))), 1)
+        # each profile keeps its own build log
+        self.assertEqual(len(list(self.rootdir.glob("bin1/.cod/*/.ninja_log"))), 2)
+        # a no-op build runs no compiles and does not rebuild the archive
+        output = check_output(("cod", "build"), cwd=self.rootdir / "bin2", text=True)
+        self.assertNotIn("CC ", output)
+        self.assertNotIn("AR ", output)
+        self.assertNotIn("NINJA ", output)
+
+class TestPrebuiltArtifact(Case):
+    directory = 'prebuilt-artifact'
+
+    def test_build(self):
+        rmtree(self.rootdir / ".cod", ignore_errors=True)
+        self.assertCodOk("inc", "package")
+        self.assertCodOk("lib", "package", "--artifact")
+        self.assertCodOk("lib2", "package")
+        self.assertCodOk("bin", "build")
+        self.assertEqual(list(self.rootdir.glob(".cod/build/lib-*")), [])
+        self.assertNotEqual(list(self.rootdir.glob(".cod/build/lib2-*")), [])
+        self.assertNotEqual(list(self.rootdir.glob("bin/.cod/*/bin/pa.elf")), [])
+
+        # nor once a header of a dependency changes
+        header = self.rootdir / "inc" / "include" / "pv.h"
+        text = header.read_text()
+        header.write_text("#define PV 0\n")
+        try:
+            self.assertCodOk("bin", "build")
+            self.assertNotEqual(list(self.rootdir.glob(".cod/build/lib-*")), [])
+        finally:
+            header.write_text(text)
+        rmtree(self.rootdir / ".cod" / "build")
+        self.assertCodOk("bin", "build")
+        self.assertEqual(list(self.rootdir.glob(".cod/build/lib-*")), [])
+
+        # the artifact is not used once the sources change
+        extra = self.rootdir / "lib" / "src" / "extra.c"
+        extra.write_text("void extra() {}\n")
+        try:
+            self.assertCodOk("bin", "build")
+            self.assertNotEqual(list(self.rootdir.glob(".cod/build/lib-*")), [])
+        finally:
+            extra.unlink()
+
+        rmtree(self.rootdir / ".cod" / "build")
+        self.assertCodOk("lib", "package")
+        self.assertEqual(list(self.rootdir.glob("lib/.cod/artifacts/*")), [])
+        self.assertCodOk("bin", "build")
+        self.assertNotEqual(list(self.rootdir.glob(".cod/build/lib-*")), [])
+
+class TestLazyLock(Case):
+    directory = 'lazy-lock'
+
+    def test_build(self):
+        with (self.rootdir / "bin" / "cod.lock").open("w") as f:
+            f.write("[release.aarch64]\nmissing-1.0-0.noarch = local\n")
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("bin", "build", "-a", "x86_64")
+        with (self.rootdir / "bin" / "cod.lock").open() as f:
+            lock = f.read()
+        self.assertIn("[release.aarch64]\nmissing-1.0-0.noarch = local\n", lock)
+        self.assertIn("[dev.x86_64]\nlib-1.0-0.noarch = local\n", lock)
+
+class TestLTO(Case):
+    directory = 'lto'
+
+    def test_build(self):
+        self.assertCodOk("include", "package")
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("bin", "build")
+        for obj in self.rootdir.glob("bin/.cod/*/obj/bin.o"):
+            with obj.open("rb") as f:
+                self.assertEqual(b"BC\xc0\xde", f.read(4))
+
+class TestPCH(Case):
+    directory = 'pch'
+
+    def test_build(self):
+        self.assertCodOk("include", "package")
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("other", "package")
+        self.assertCodOk("bin", "build")
+        self.assertTrue(list(self.rootdir.glob("lib/.cod/*/lib-1.0-0.noarch/pch/pc.h.pch")))
+        self.assertTrue(list(self.rootdir.glob("bin/.cod/*/obj/pch/common.h.pch")))
+        # only packages including the exporting package get its pch
+        [lib] = self.rootdir.glob(".cod/build/lib-*/lib.ninja")
+        self.assertIn("-include-pch", lib.read_text())
+        [other] = self.rootdir.glob(".cod/build/other-*/lib.ninja")
+        self.assertNotIn("-include-pch", other.read_text())
+
+class TestUnity(Case):
+    directory = 'unity'
+
+    def test_build(self):
+        from cod.thin import parse_armap
+        from cod.workspace import get_native_arch
+        self.assertCodOk("lib", "package")
+        symbols = dict(parse_armap(self.rootdir / f"lib/.cod/release.{get_native_arch()}/lib/liblib.a"))
+        self.assertEqual({"ua", "ub", "uc", "ud"}, set(symbols))
+        self.assertEqual(symbols["ua"], symbols["ub"])
+        self.assertEqual("c.o", symbols["uc"].name)
+        self.assertCodOk("bin", "build")
+
+class TestLimitedBuild(Case):
+    directory = 'symbol-dependency'
+
+    def test_build(self):
+        self.assertCodOk("include", "package", "-j", "1")
+        self.assertCodOk("lib", "package", "-j", "2", "--memory", "1G")
+        self.assertCodOk("bin", "build", "-j", "2", "-l", "64", "--memory", "1G")
+
+class TestHeaderMap(Case):
+    directory = 'header-map'
+
+    def test_build(self):
+        from cod import hmap
+        from cod.workspace import get_native_arch
+        rmtree(self.rootdir / ".cod", ignore_errors=True)
+        for name in ("hm1", "hm2", "hm3"):
+            self.assertCodOk(name, "package")
+        self.assertCodOk("bin", "build")
+
+        def entries(pattern):
+            path, = self.rootdir.glob(pattern)
+            return set(hmap.read(path.read_bytes()))
+        self.assertEqual({"hm1.h", "hm2.h", "hm3.h"}, entries(f"bin/.cod/dev.{get_native_arch()}/obj/include.hmap"))
+        self.assertEqual({"hm1.h", "hm2.h"}, entries(".cod/build/hm2-*/*/include.hmap"))
+        self.assertEqual({"hm3.h"}, entries(".cod/build/hm3-*/*/include.hmap"))
+
+class TestMatrixBuild(Case):
+    directory = 'symbol-dependency'
+
+    def test_build(self):
+        self.assertCodOk("include", "package")
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("bin", "build", "-p", "dev", "-p", "release", "-a", "x86_64", "-a", "i686")
+        for profile in ("dev.x86_64", "dev.i686", "release.x86_64", "release.i686"):
+            self.assertTrue((self.rootdir / "bin/.cod" / profile / "bin/sc.elf").exists())
+        self.assertTrue((self.rootdir / "bin/.cod/build.ninja").exists())
+        self.assertCodOk("bin", "build", "-p", "release", "-a", "i686")
+
+class TestFrozenBuild(Case):
+    directory = 'symbol-dependency'
+
+    def test_build(self):
+        from cod.workspace import get_native_arch
+        self.assertCodOk("include", "package")
+        self.assertCodOk("lib", "package")
+        self.assertCodFail("bin", "build", "--frozen")
+        self.assertCodOk("bin", "build")
+        rmtree(self.rootdir / "bin" / ".cod")
+        self.assertCodOk("bin", "build", "--frozen")
+        with (self.rootdir / "bin" / "cod.lock").open("w") as f:
+            f.write(f"[dev.{get_native_arch()}]\ninclude-1.0-0.noarch = local\n")
+        self.assertCodFail("bin", "build", "--locked")
+
+class TestPrune(Case):
+    directory = 'prune'
+
+    def test_build(self):
+        for directory in ("include", "lib", "extra"):
+            self.assertCodOk(directory, "package")
+        self.assertCodOk("bin", "install", "extra")
+        self.assertCodOk("bin", "build")
+        with (self.rootdir / "bin" / "cod.lock").open() as f:
+            self.assertIn("extra-1.0-0", f.read())
+        self.assertCodOk("bin", "lock", "--prune")
+        with (self.rootdir / "bin" / "cod.lock").open() as f:
+            lock = f.read()
+        self.assertNotIn("extra-1.0-0", lock)
+        self.assertIn("include-1.0-0", lock)
+        self.assertIn("lib-1.0-0", lock)
+        self.assertCodOk("bin", "install", "extra")
+        self.assertCodOk("bin", "build", "--prune")
+        with (self.rootdir / "bin" / "cod.lock").open() as f:
+            self.assertNotIn("extra-1.0-0", f.read())
+        self.assertCodOk("bin", "build", "--frozen")
+
+class TestSize(Case):
+    directory = 'symbol-dependency'
+
+    def test_size(self):
+        import json
+        from subprocess import check_output
+        self.assertCodOk("include", "package")
+        self.assertCodOk("lib", "package")
+        self.assertCodOk("bin", "build")
+        output = check_output(("cod", "size", "--json"), cwd=self.rootdir/"bin")
+        report = json.loads(output)["bin/sc.elf"]
+        self.assertEqual("lib-1.0-0.noarch", report["symbols"]["sc"]["package"])
+        self.assertEqual("bin-1.0-0.noarch", report["symbols"]["main"]["package"])
+        self.assertGreater(report["packages"]["lib-1.0-0.noarch"]["text"], 0)
+
+        (self.rootdir/"bin"/".cod"/"size.json").write_bytes(output)
+        output = check_output(("cod", "size", "--json", "--diff", ".cod/size.json"), cwd=self.rootdir/"bin")
+        self.assertEqual({"packages": {}, "symbols": {}}, json.loads(output)["bin/sc.elf"])
+
+class TestSizeStatics(Case):
+    directory = 'size-statics'
+
+    def test_size(self):
+        import json
+        from subprocess import check_output
+        self.assertCodOk("lib1", "package")
+        self.assertCodOk("lib2", "package")
+        self.assertCodOk("bin", "build")
+        output = check_output(("cod", "size", "--json"), cwd=self.rootdir/"bin")
+        symbols = json.loads(output)["bin/init.elf"]["symbols"]
+        # static symbols of sources with the same name in different packages
+        self.assertEqual({"package": "lib1-1.0-0.noarch", "section": "bss", "size": 16}, symbols["lib1-1.0-0.noarch/src/init.c:buf"])
+        self.assertEqual({"package": "lib2-1.0-0.noarch", "section": "bss", "size": 32}, symbols["lib2-1.0-0.noarch/src/init.c:buf"])
@@ -0,0 +1,3 @@
+void
+cc2() {
+}
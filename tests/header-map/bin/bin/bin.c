@@ -0,0 +1,7 @@
+#include <hm2.h>
+#include <hm3.h>
+
+int
+main() {
+  return hm2() + hm3();
+}
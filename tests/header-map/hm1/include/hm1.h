@@ -0,0 +1,3 @@
+#pragma once
+
+int hm1(void);
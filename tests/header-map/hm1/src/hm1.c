@@ -0,0 +1,6 @@
+#include <hm1.h>
+
+int
+hm1(void) {
+  return 1;
+}
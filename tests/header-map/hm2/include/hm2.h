@@ -0,0 +1,5 @@
+#pragma once
+
+#include <hm1.h>
+
+int hm2(void);
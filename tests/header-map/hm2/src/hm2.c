@@ -0,0 +1,6 @@
+#include <hm2.h>
+
+int
+hm2(void) {
+  return hm1() + 1;
+}
@@ -0,0 +1,6 @@
+#include <hm3.h>
+
+int
+hm3(void) {
+  return 3;
+}
@@ -0,0 +1,6 @@
+#include <ll.h>
+
+int
+main() {
+  return ll();
+}
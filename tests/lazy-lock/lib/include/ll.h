@@ -0,0 +1,5 @@
+#pragma once
+
+static inline int ll() {
+  return 0;
+}
@@ -0,0 +1,6 @@
+#include <lt.h>
+
+int
+main() {
+  return lt(1);
+}
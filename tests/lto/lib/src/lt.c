@@ -0,0 +1,6 @@
+#include <lt.h>
+
+int
+lt(int x) {
+  return x + 1;
+}
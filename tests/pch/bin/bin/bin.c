@@ -0,0 +1,8 @@
+#include "common.h"
+
+int other(int);
+
+int
+main() {
+  return other(pc(COMMON_ARG));
+}
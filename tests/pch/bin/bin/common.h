@@ -0,0 +1,5 @@
+#pragma once
+
+#include <pc.h>
+
+#define COMMON_ARG 1
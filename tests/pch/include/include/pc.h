@@ -0,0 +1,5 @@
+#pragma once
+
+#define PC_BASE 1
+
+int pc(int);
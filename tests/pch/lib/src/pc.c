@@ -0,0 +1,6 @@
+#include <pc.h>
+
+int
+pc(int x) {
+  return x + PC_BASE;
+}
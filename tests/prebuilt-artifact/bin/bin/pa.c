@@ -0,0 +1,7 @@
+#include <pa.h>
+
+int
+main() {
+  pa();
+  return 0;
+}
@@ -0,0 +1 @@
+#define PV 1
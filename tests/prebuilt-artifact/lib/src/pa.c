@@ -0,0 +1,10 @@
+#include <pa.h>
+#include <pv.h>
+
+void pb();
+
+void
+pa() {
+  if (PV)
+    pb();
+}
@@ -0,0 +1,7 @@
+#include <pr.h>
+
+int
+main() {
+  pr();
+  return 0;
+}
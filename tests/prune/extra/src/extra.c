@@ -0,0 +1,5 @@
+#include <extra.h>
+
+void
+extra() {
+}
@@ -0,0 +1,5 @@
+#include <pr.h>
+
+void
+pr() {
+}
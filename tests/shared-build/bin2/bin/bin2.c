@@ -0,0 +1,7 @@
+#include <sb.h>
+
+int
+main() {
+  sb();
+  return 0;
+}
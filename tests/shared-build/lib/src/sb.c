@@ -0,0 +1,5 @@
+#include <sb.h>
+
+void
+sb() {
+}
@@ -0,0 +1,7 @@
+char *l1();
+char *l2();
+
+int
+main() {
+  return l1() == l2();
+}
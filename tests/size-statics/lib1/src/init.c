@@ -0,0 +1,6 @@
+static char buf[16];
+
+char *
+l1() {
+  return buf;
+}
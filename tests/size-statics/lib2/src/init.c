@@ -0,0 +1,6 @@
+static char buf[32];
+
+char *
+l2() {
+  return buf;
+}
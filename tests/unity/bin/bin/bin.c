@@ -0,0 +1,6 @@
+#include <u.h>
+
+int
+main() {
+  return ua() + ub() + uc() + ud();
+}
@@ -0,0 +1,6 @@
+#pragma once
+
+int ua(void);
+int ub(void);
+int uc(void);
+int ud(void);
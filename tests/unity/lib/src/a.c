@@ -0,0 +1,11 @@
+#include <u.h>
+
+static int
+helper(void) {
+  return 'a';
+}
+
+int
+ua(void) {
+  return helper();
+}
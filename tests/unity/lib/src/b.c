@@ -0,0 +1,6 @@
+#include <u.h>
+
+int
+ub(void) {
+  return 'b';
+}
@@ -0,0 +1,11 @@
+#include <u.h>
+
+static int
+helper(void) {
+  return 'c';
+}
+
+int
+uc(void) {
+  return helper();
+}
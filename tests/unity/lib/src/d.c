@@ -0,0 +1,6 @@
+#include <u.h>
+
+int
+ud(void) {
+  return 'd';
+}